@@ -6,22 +6,27 @@ import discord
 import tiktoken
 import xmltodict
 from random import random
-from difflib import get_close_matches
 from datetime import datetime, timezone
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, Omit
 from openai.types.chat import ChatCompletionMessageFunctionToolCall
 from redbot.core import commands
 from redbot.core.bot import Red
 
 import agent.utils as utils
 import agent.constants as constants
-from agent.schema import CompletionResult, MemoryChangeResult, MemoryChangeList
+from agent.schema import CompletionResult, MemoryChangeResult, MemoryChangeList, StructuredObject, ImageCaptionList
 from agent.schema import AgentMessage, AgentImageContent, ImageGenParams, MessageReaction, ReactionResult
 from agent.commands import AgentCogCommands
 from agent.config_commands import AgentCogConfigCommands
-from agent.tools.base import get_all_tools
+from agent.tools.base import ToolBase, get_all_tools
 from agent.tools.update_memory import UpdateMemoryTool
+from agent.tools.booru_tags import BooruTagsTool
 from agent.context_builder import ContextBuilder
+from agent.precaptioner import Precaptioner
+from agent.background_memorizer import BackgroundMemorizer
+from agent.trigger_filter import TRIGGER_FIELDS
+from agent.config import ConfigField
+from agent.response_stream import ResponseStream
 from agent.views.memory_change import MemoryChangeView
 
 log = logging.getLogger("agent")
@@ -34,18 +39,35 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
         super().__init__(bot)
         self.encoding = tiktoken.get_encoding(constants.TOKEN_ENCODING)
         self.context_builder = ContextBuilder(self)
+        self.precaptioner = Precaptioner(self)
+        self.background_memorizer = BackgroundMemorizer(self)
         self.available_tools = set(get_all_tools())
         all_tool_names = [tool.display_name for tool in self.available_tools]
         log.info(f"{all_tool_names=}")
 
 
     async def cog_load(self):
-        await self.config.load_all(self.bot)
+        await self.config.load_global()
+        self.config.listeners.append(self.on_config_change)
+        self.config.start_write_behind(constants.CONFIG_FLUSH_INTERVAL)
+        await self.memory_store.open()
+        await self.migrate_memories()
         await self.initialize_function_calls()
         await self.initialize_openai_client()
+        BooruTagsTool.load_index(self)
+        await self.image_cache.load()
+        await self.precaptioner.start(self.config.precaption_concurrency.value)
 
 
     async def cog_unload(self):
+        await self.precaptioner.stop()
+        self.background_memorizer.stop()
+        self.recall_cache.clear()
+        self.worker_pool.shutdown()
+        self.image_pool.shutdown()
+        await self.config.stop_write_behind()  # before anything that may raise, so that pending changes are saved
+        await self.image_cache.close()
+        await self.memory_store.close()
         if self.session:
             await self.session.close()
         if self.openai_client:
@@ -56,6 +78,17 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             await self.openwebui_client.close()
 
 
+    async def migrate_memories(self):
+        """Moves memories out of the old config into the memory store, once."""
+        if self.config.memories_migrated.value:
+            return  # reading every guild's config would undo loading them lazily
+        for guild_id, values in (await self.config.raw.all_guilds()).items():
+            if values.get("memory"):
+                await self.memory_store.migrate(guild_id, values["memory"])
+                await self.config.raw.guild_from_id(guild_id).clear_raw("memory")
+        await self.config.memories_migrated.set(True)
+
+
     async def initialize_function_calls(self):
         all_function_calls = get_all_tools()
         self.available_tools = set(all_function_calls)
@@ -106,6 +139,19 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             return self.openai_client
 
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            await self.config.load_guild(ctx.guild)
+            await self.config.load_channel(ctx.channel)
+
+
+    def on_config_change(self, field: ConfigField):
+        if field.name in TRIGGER_FIELDS:
+            for guild_id, config in self.config.guild.items():
+                if config is field.owner:
+                    self.trigger_filter.invalidate(guild_id)
+
+
     @commands.Cog.listener()
     async def on_red_api_tokens_update(self, service_name, _):
         await self.initialize_function_calls()
@@ -115,6 +161,15 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        self.message_cache.add(message)
+        if not message.guild:
+            return
+        triggers = self.trigger_filter.get(message.guild.id)
+        if triggers is None:
+            triggers = self.trigger_filter.build(message.guild.id, await self.config.load_guild(message.guild))
+        self.precaptioner.submit(message)
+        if not self.trigger_filter.accepts(triggers, message, self.bot.user):
+            return
         if message.id in self.currently_responding:
             return
         self.currently_responding.add(message.id)
@@ -142,7 +197,7 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
 
         # autoresponse or autoreaction
         if self.bot.user not in ctx.message.mentions:
-            if config.auto_channel_mode == "blacklist" and ctx.channel.id in config.auto_channels.value:
+            if config.auto_channel_mode.value == "blacklist" and ctx.channel.id in config.auto_channels.value:
                 return
             if config.auto_channel_mode.value == "whitelist" and ctx.channel.id not in config.auto_channels.value:
                 return
@@ -189,18 +244,57 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             asyncio.create_task(ctx.message.add_reaction(self.config.noresponse_emoji.value))
     
 
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        await self.message_cache.update(payload)
+
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.message_cache.remove(payload.channel_id, {payload.message_id})
+
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.message_cache.remove(payload.channel_id, payload.message_ids)
+
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # a new gateway session may have skipped events
+        self.message_cache.clear()
+        self.member_index.clear()
+
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.member_index.add(member)
+
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.member_index.remove(payload.guild_id, payload.user)
+
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.member_index.clear(guild.id)
+
+
     @commands.Cog.listener()
     async def on_user_update(self, before: discord.User, after: discord.User):
         if before.name == after.name:
             return
-        for guild in self.bot.guilds:
-            config = self.config.guild.get(guild.id)
-            if not config:
+        self.member_index.rename(before, after)
+        for guild_id in self.memory_store.guilds_with(before.name):
+            if not self.bot.get_guild(guild_id):
                 continue
-            if before.name in config.memory.value:
-                config.memory.value[after.name] = config.memory.value[before.name]
-                del config.memory.value[before.name]
-                await config.memory.save()
+            memory = self.memory_store.get(guild_id)
+            if before.name in memory:
+                replaced = memory.get(after.name)
+                memory[after.name] = memory.pop(before.name)
+                changes = [MemoryChangeResult(before.name, memory[after.name], None), MemoryChangeResult(after.name, replaced, memory[after.name])]
+                await self.memory_store.save(guild_id, changes, "rename")
                 log.info(f"Moved user memory {before.name=} {after.name=}")
 
 
@@ -240,21 +334,18 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
     async def run_response(self, ctx: commands.Context, auto: bool = False):
         assert ctx.guild
         config = self.config[ctx.guild]
-        memory_names = list(config.memory.value.keys())
+        memory_names = list(self.memory_store.get(ctx.guild.id).keys())
         start = time.perf_counter()
         result = CompletionResult()
-        mem_task = None
         async with utils.bot_is_typing(ctx.channel):
             backread = await self.fetch_message_history(ctx)
             messages = await self.context_builder.build_context(ctx, backread, config, result, self.encoding)
             participants = list(set([ctx.guild.get_member(msg.author.id) or msg.author for msg in backread]))
-            recalled_memories = await self.execute_recaller(ctx, participants, messages, memory_names, result)
+            recalled_memories = await self.recall_memories(ctx, participants, backread, messages, memory_names, result)
             recalled_memories_str = self.build_memory_string(memory_names, recalled_memories, ctx, participants)
-            if not auto and config.allow_memorizer.value:
-                mem_task = asyncio.create_task(self.execute_memorizer(ctx, messages, memory_names, recalled_memories_str, result, standalone=True))
             await self.execute_responder(ctx, messages, memory_names, recalled_memories_str, result, auto)
-            if mem_task:
-                await mem_task
+            if not auto and config.allow_memorizer.value:
+                self.background_memorizer.submit(ctx, recalled_memories_str)
         result.elapsed_ms = int(1000 * (time.perf_counter() - start))
         log.info(result)
 
@@ -269,6 +360,44 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
         log.info(result)
 
 
+    async def recall_memories(self,
+                              ctx: commands.Context,
+                              participants: list[discord.Member | discord.User],
+                              backread: list[discord.Message],
+                              messages: list[AgentMessage],
+                              memories: list[str],
+                              result: CompletionResult
+                              ) -> dict[str, str]:
+        """
+        Reuses the memories recalled for the previous response in this channel if the conversation hasn't moved much,
+        refreshing them in the background for the next response. Otherwise runs the recaller and waits for it.
+        """
+        assert ctx.guild
+        config = self.config[ctx.guild]
+        if not config.recall_cache.value or config.recall_mode.value == "local":
+            return await self.execute_recaller(ctx, participants, messages, memories, result)
+        participant_ids = frozenset(p.id for p in participants)
+        message_ids = [msg.id for msg in backread]
+        cached_names = self.recall_cache.get(ctx.channel.id, participant_ids, message_ids)
+        if cached_names is None:
+            recalled_memories = await self.execute_recaller(ctx, participants, messages, memories, result)
+            self.recall_cache.put(ctx.channel.id, participant_ids, message_ids, set(recalled_memories))
+            return recalled_memories
+
+        async def refresh():
+            refresh_result = CompletionResult()
+            try:
+                refreshed = await self.execute_recaller(ctx, participants, messages, memories, refresh_result)
+            except Exception:
+                log.exception("Refreshing recalled memories")
+                return self.recall_cache.clear(ctx.channel.id)
+            self.recall_cache.put(ctx.channel.id, participant_ids, message_ids, set(refreshed))
+            log.info(f"Recall refresh {refresh_result}")
+
+        self.recall_cache.refresh(ctx.channel.id, refresh())
+        return {k: v for k, v in self.memory_store.get(ctx.guild.id).items() if k in cached_names}
+
+
     async def execute_recaller(self,
                                ctx: commands.Context,
                                participants: list[discord.Member | discord.User],
@@ -295,6 +424,25 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                 temp_memories.remove(memory)
                 memories_to_recall.add(memory)
 
+        mode = config.recall_mode.value
+        local_candidates: list[str] = []
+        if mode != "llm" or self.config.extended_logging.value:
+            start = time.perf_counter()
+            query = "\n".join(str(msg["content"]) for msg in temp_messages[-config.backread_short.value:])
+            limit = config.recall_top_k.value * (constants.RECALL_RERANK_FACTOR if mode == "rerank" else 1)
+            local_candidates = [memory for memory in self.memory_store.search(ctx.guild.id, query, limit) if memory not in memories_to_recall]
+            local_ms = int(1000 * (time.perf_counter() - start))
+            log.info(f"Local recall {len(local_candidates)} candidates from {len(self.memory_store.get(ctx.guild.id))} memories {local_ms=}")
+        if mode == "local":
+            memories_to_recall.update(local_candidates)
+            if self.config.extended_logging.value:
+                log.info(f"{memories_to_recall=}")
+            return {k: v for k, v in self.memory_store.get(ctx.guild.id).items() if k in memories_to_recall}
+        if mode == "rerank":
+            temp_memories = local_candidates
+            if not temp_memories:
+                return {k: v for k, v in self.memory_store.get(ctx.guild.id).items() if k in memories_to_recall}
+
         temp_memories_str = ", ".join(temp_memories)
         system_content = config.prompt_recaller.value.format(temp_memories_str)
         system_prompt = {
@@ -328,8 +476,12 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
         
         if self.config.extended_logging.value:
             log.info(f"{memories_to_recall=}")
+            if mode == "llm" and (chosen := memories_to_recall - set(participant_names)):
+                # how many of the recaller's choices the local index would have found, to evaluate the local modes
+                local_recall = len(chosen & set(local_candidates)) / len(chosen)
+                log.info(f"{local_recall=:.0%}")
 
-        recalled_memories = {k: v for k, v in config.memory.value.items() if k in memories_to_recall}
+        recalled_memories = {k: v for k, v in self.memory_store.get(ctx.guild.id).items() if k in memories_to_recall}
         return recalled_memories or {}
   
 
@@ -388,10 +540,48 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
         past_memory_changes: list[MemoryChangeResult] = []
         past_tool_calls: list[str] = []
         files: list[discord.File] = []
+        stream = ResponseStream(ctx, do_reply=not auto) if config.stream_responses.value else None
+        memory_lock = asyncio.Lock()
+
+        def tool_timeout(cls: type[ToolBase]) -> float:
+            """The tool's own timeout, cut short so that it ends before the response times out as a whole."""
+            remaining = self.config.response_timeout.value - (time.perf_counter() - result.start) - constants.TOOL_TIMEOUT_MARGIN
+            return max(1.0, min(cls.timeout, remaining))
+
+        async def run_tool_call(call: ChatCompletionMessageFunctionToolCall, semaphore: asyncio.Semaphore) -> tuple[StructuredObject | str, int]:
+            async with semaphore:
+                start = time.perf_counter()
+                timeout = 0.0
+                try:
+                    cls = next(t for t in tools if t.schema.function.name == call.function.name)
+                    if cls is UpdateMemoryTool:
+                        async with memory_lock:
+                            if past_memory_changes:  # only allow one memory update per response
+                                changes = []
+                            else:
+                                timeout = tool_timeout(cls)
+                                changes = await asyncio.wait_for(
+                                    self.execute_memorizer(ctx, messages, memory_names, recalled_memories_str, result, standalone=False),
+                                    timeout=timeout)
+                                past_memory_changes.extend(changes)
+                                await self.background_memorizer.advance(ctx)
+                        args = {"changes": changes}
+                    else:
+                        args = json.loads(call.function.arguments)
+                    timeout = tool_timeout(cls)
+                    tool_result = await asyncio.wait_for(cls(ctx, self).run(args), timeout=timeout)
+                except asyncio.TimeoutError:
+                    tool_result = "<error>Timed out.</error>"
+                    log.warning(f"Calling tool {call.function.name}: timed out after {timeout:.0f} seconds")
+                except Exception:  # tools should handle specific errors internally, but broad errors should not stop the responder
+                    tool_result = "<error>Unhandled error, please contact the developer</error>"
+                    log.exception(f"Calling tool {call.function.name}")
+                return tool_result, int(1000 * (time.perf_counter() - start))
         for depth in range(config.max_tool_depth.value):
             can_use_tools = depth < config.max_tool_depth.value - 1
             if not can_use_tools and depth > 0:
                 temp_messages.extend(constants.FAKE_TOOL_CALL)  # type: ignore
+            result.image_payload_bytes += utils.image_payload_bytes(temp_messages)  # resent on every tool depth
             response = await self.get_client(model).chat.completions.create(
                 model=utils.clean_model(model),
                 reasoning_effort=utils.adjusted_effort(model, config.effort_responder.value),  # type: ignore
@@ -399,10 +589,14 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                 max_completion_tokens=config.response_tokens.value,  # type: ignore
                 tools=tools_schema,  # type: ignore
                 tool_choice="auto" if can_use_tools else "none",
+                stream=stream is not None,
+                stream_options={"include_usage": True} if stream else Omit(),
                 extra_body=None if "/" not in model else {
                     "session_id": str(ctx.message.id),
                 },
             )
+            if stream:
+                response = await stream.consume(response)  # type: ignore
             if response is None:
                 log.error(f"OpenAI SDK returned NoneType")
                 return
@@ -431,26 +625,21 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             if not can_use_tools or not response.choices[0].message.tool_calls:
                 break
                   
-            temp_messages.append(response.choices[0].message)  # type: ignore
-            for call in response.choices[0].message.tool_calls:
-                assert isinstance(call, ChatCompletionMessageFunctionToolCall)
+            calls = [call for call in response.choices[0].message.tool_calls if isinstance(call, ChatCompletionMessageFunctionToolCall)]
+            # a plain message, streamed completions carry parsed fields that aren't part of the request format
+            assistant_message = {"role": "assistant", "content": response.choices[0].message.content}
+            if calls:
+                assistant_message["tool_calls"] = [{
+                    "id": call.id,
+                    "type": "function",
+                    "function": {"name": call.function.name, "arguments": call.function.arguments},
+                } for call in calls]
+            temp_messages.append(assistant_message)  # type: ignore
+            semaphore = asyncio.Semaphore(max(1, self.config.tool_concurrency.value))
+            tool_results = await asyncio.gather(*[run_tool_call(call, semaphore) for call in calls])
+            for call, (tool_result, elapsed_ms) in zip(calls, tool_results):  # in the original order
                 result.tool_calls += 1
-                try:
-                    cls = next(t for t in tools if t.schema.function.name == call.function.name)
-                    if cls is UpdateMemoryTool:
-                        if past_memory_changes:  # only allow one memory update per response
-                            changes = []
-                        else:
-                            changes = await self.execute_memorizer(ctx, messages, memory_names, recalled_memories_str, result, standalone=False)
-                            past_memory_changes += changes
-                        args = {"changes": changes}
-                    else:
-                        args = json.loads(call.function.arguments)
-                    tool_result = await cls(ctx, self).run(args)
-                except Exception:  # tools should handle specific errors internally, but broad errors should not stop the responder
-                    tool_result = "<error>Unhandled error, please contact the developer</error>"
-                    log.exception(f"Calling tool {call.function.name}")
-
+                result.tools_ms[call.function.name] = result.tools_ms.get(call.function.name, 0) + elapsed_ms
                 past_tool_calls.append(call.function.name)
                 if isinstance(tool_result, dict):
                     if (file := tool_result.pop("file", None)) and isinstance(file, discord.File):
@@ -466,7 +655,7 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                 if len(tool_text) > config.max_tool.value:
                     tool_text = utils.fix_truncated_xml(tool_text[:config.max_tool.value]) + "..."
                 result.tokens.tools += len(self.encoding.encode(tool_text))
-                log.info(f"{call.function.name=} {call.function.arguments=}")
+                log.info(f"{call.function.name=} {call.function.arguments=} {elapsed_ms=}")
                 if self.config.extended_logging.value:
                     log.info(f"{tool_text=}")
               
@@ -493,20 +682,22 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                     break
             if prompt and "generate_stable_diffusion" not in past_tool_calls:
                 await self.generate_stable_diffusion(ctx, prompt)
-            # cleanup
-            for _, pattern, repl in constants.RESPONSE_CLEANUP_PATTERNS:
-                completion = pattern.sub(repl, completion)
-            completion = constants.INCOMPLETE_EMOTE_PATTERN.sub(utils.fix_emote(ctx.bot), completion)
-            completion = constants.FAKE_EMOTE_PATTERN.sub("\n", completion)
-            completion = utils.undo_xml(completion).strip()
+            completion = utils.clean_response(ctx.bot, completion)
             if self.config.extended_logging.value and completion != raw_completion:
                 log.info(f"cleaned_{completion=}")
 
         view = MemoryChangeView(past_memory_changes, standalone=False) if past_memory_changes else None
-        if completion or view or files:
-            await utils.chunk_and_send(ctx, completion, embed=None, view=view, files=files, do_reply=not auto)
+        if stream and stream.messages:
+            await stream.finish(completion, view=view, files=files)
+            if not stream.messages:
+                await ctx.message.add_reaction(self.config.noresponse_emoji.value)
+        elif completion or view or files:
+            if first_sent_at := await utils.chunk_and_send(ctx, completion, embed=None, view=view, files=files, do_reply=not auto):
+                result.first_text_ms = int(1000 * (first_sent_at - result.start))
         else:
             await ctx.message.add_reaction(self.config.noresponse_emoji.value)
+        if stream and stream.first_sent_at:
+            result.first_text_ms = int(1000 * (stream.first_sent_at - result.start))
 
         response_message = {
             "role": "assistant",
@@ -521,17 +712,20 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                                 memory_names: list[str],
                                 recalled_memories_str: str,
                                 result: CompletionResult,
-                                standalone: bool
+                                standalone: bool,
+                                num_messages: int | None = None
                                 ) -> list[MemoryChangeResult]:
         """
         Runs an openai completion with the chat history, a list of memories, and the contents of some memories,
         and executes database operations as decided by the LLM.
+        Only the last num_messages are read, backread_short by default.
         """
         assert ctx.guild and ctx.guild.me
         config = self.config[ctx.guild]
 
         if config.memorizer_user_only.value:
-            memory_names = [memory for memory in memory_names if any(member.name == memory for member in ctx.guild.members)]
+            member_names = self.member_index.names(ctx.guild)
+            memory_names = [memory for memory in memory_names if memory in member_names]
         memory_names_obj = {
             "memory_names": {
                 "#text": ", ".join(memory_names),
@@ -550,7 +744,7 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
 
         prefixes = await self.bot.get_valid_prefixes(ctx.guild)
         temp_messages = [msg for msg in utils.get_text_contents(messages) if not utils.is_bot_command(msg, prefixes)]
-        num_backread = config.backread_short.value
+        num_backread = num_messages or config.backread_short.value
         if len(temp_messages) > num_backread:
             temp_messages = temp_messages[-num_backread:]
         temp_messages.insert(0, system_prompt)  # type: ignore
@@ -577,15 +771,15 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             return []
 
         memory_changes: list[MemoryChangeResult] = []
-        memory = config.memory.value
+        memory = self.memory_store.get(ctx.guild.id)
         for change in completion.parsed.memory_changes:
             action, name, content = change.action_type, change.memory_name, change.memory_content
 
             if name not in memory and action != "create":
-                matches = get_close_matches(name, memory)
-                if not matches:
+                match = self.memory_store.closest(ctx.guild.id, name)
+                if not match or match not in memory:
                     continue
-                name = matches[0]
+                name = match
 
             content = content.strip()
             before = memory.get(name)
@@ -604,7 +798,7 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             if before != after:
                 memory_changes.append(MemoryChangeResult(name, before, after))
         
-        await config.memory.save()
+        await self.memory_store.save(ctx.guild.id, memory_changes, "memorizer")
 
         if standalone and memory_changes and config.memorizer_alerts.value:
             view = MemoryChangeView(memory_changes, standalone)
@@ -721,19 +915,73 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
             else:
                 result.tokens.captioner = tokens
         return caption
+
+
+    async def execute_batch_captioner(self, ctx: commands.Context, images: list[AgentImageContent], result: CompletionResult) -> list[str | None]:
+        """Captions several images in a single request. Images the model skipped have a caption of None."""
+        assert ctx.guild
+        config = self.config[ctx.guild]
+
+        content: list[AgentImageContent] = []
+        for i, image in enumerate(images):
+            content.append({"type": "text", "text": f"Image {i + 1}:"})
+            content.append(image)
+        messages: list[AgentMessage] = [
+            {
+                "role": "system",
+                "content": config.prompt_captioner.value + constants.CAPTION_BATCH_INSTRUCTIONS.format(len(images)),
+            },
+            {
+                "role": "user",
+                "content": content,
+            }
+        ]
+        model = config.model_captioner.value
+        effort = "none"
+        response = await self.get_client(model).chat.completions.parse(
+            model=utils.clean_model(model),
+            reasoning_effort=utils.adjusted_effort(model, effort),  # type: ignore
+            messages=messages,  # type: ignore
+            response_format=ImageCaptionList,
+            extra_body=None if "/" not in model else {
+                "session_id": str(ctx.message.id),
+            },
+        )
+        captions: list[str | None] = [None] * len(images)
+        completion = response.choices[0].message if response.choices else None
+        if completion and completion.parsed:
+            for item in completion.parsed.captions:
+                if 1 <= item.image_number <= len(images) and item.caption:
+                    captions[item.image_number - 1] = item.caption
+        if self.config.extended_logging.value:
+            log.info(f"{captions=}")
+        if response.usage:
+            if cost := getattr(response.usage, "cost", 0.0):
+                result.add_cost(cost)
+            tokens = (response.usage.prompt_tokens, response.usage.completion_tokens)
+            if isinstance(result.tokens.captioner, tuple):
+                result.tokens.captioner = (result.tokens.captioner[0] + tokens[0], result.tokens.captioner[1] + tokens[1])
+            else:
+                result.tokens.captioner = tokens
+        return captions
     
 
-    async def fetch_message_history(self, ctx: commands.Context, short: bool = False) -> list[discord.Message]:
+    async def fetch_message_history(self, ctx: commands.Context, short: bool = False, limit: int | None = None, ignore_start: bool = False) -> list[discord.Message]:
+        """
+        The triggering message followed by the messages before it, newest first.
+        Tools looking for attachments pass their own limit and ignore_start, to see past [p]forget like they always have.
+        """
         assert ctx.guild and isinstance(ctx.channel, (discord.TextChannel, discord.Thread))
         config = self.config[ctx.guild]
         channel_config = await self.config.load_channel(ctx.channel)
-        limit = config.backread_short.value if short else config.backread_messages.value
-        backread = [message async for message in ctx.channel.history(
+        if limit is None:
+            limit = config.backread_short.value if short else config.backread_messages.value
+        backread = await self.message_cache.history(
+            ctx.channel,
             limit=limit,
             before=ctx.message,
-            after=channel_config.start.value,
-            oldest_first=False
-        )]
+            after=constants.DISCORD_EPOCH_DATETIME if ignore_start else channel_config.start.value,
+        )
         backread.insert(0, ctx.message)
         return backread
 
@@ -745,7 +993,7 @@ class AgentCog(AgentCogCommands, AgentCogConfigCommands):
                 "memory": []
             }
         }
-        member_names = [member.name for member in ctx.guild.members]
+        member_names = self.member_index.names(ctx.guild)
         temp: dict[str, dict[str, str]] = {}
         for name, content in recalled_memories.items():
             if name not in memory_names:
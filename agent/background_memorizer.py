@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from redbot.core import commands
+
+from agent.schema import CompletionResult
+from agent.constants import MEMORIZER_QUIET_PERIOD, MEMORIZER_BATCH_TURNS
+
+if TYPE_CHECKING:
+    from agent.agent import AgentCog
+
+log = logging.getLogger("agent.background_memorizer")
+
+
+@dataclass
+class PendingMemorization:
+    ctx: commands.Context  # the latest response trigger, messages up to it are memorized
+    recalled_memories_str: str
+    turns: int = 0
+
+
+class BackgroundMemorizer:
+    """
+    Runs the memorizer after conversations, instead of alongside every response.
+    Turns are batched per channel until the channel goes quiet or enough of them pile up,
+    and only the messages after the channel's watermark (the last memorized message) are sent,
+    so that overlapping windows of chat aren't memorized over and over.
+    """
+    def __init__(self, cog: "AgentCog"):
+        self.cog = cog
+        self.pending: dict[int, PendingMemorization] = {}
+        self.timers: dict[int, asyncio.TimerHandle] = {}
+        self.locks: dict[int, asyncio.Lock] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.runs = 0
+        self.skipped = 0
+        self.turns = 0
+
+    def submit(self, ctx: commands.Context, recalled_memories_str: str):
+        channel_id = ctx.channel.id
+        pending = self.pending.setdefault(channel_id, PendingMemorization(ctx, recalled_memories_str))
+        pending.ctx, pending.recalled_memories_str = ctx, recalled_memories_str
+        pending.turns += 1
+        if timer := self.timers.pop(channel_id, None):
+            timer.cancel()
+        if pending.turns >= MEMORIZER_BATCH_TURNS:
+            self.flush(channel_id)
+        else:
+            self.timers[channel_id] = asyncio.get_running_loop().call_later(MEMORIZER_QUIET_PERIOD, self.flush, channel_id)
+
+    def flush(self, channel_id: int):
+        self.timers.pop(channel_id, None)
+        if not (pending := self.pending.pop(channel_id, None)):
+            return
+        task = asyncio.create_task(self.run(pending))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def stop(self):
+        """Drops pending work. It isn't lost, as the watermark wasn't moved."""
+        for timer in self.timers.values():
+            timer.cancel()
+        for task in self.tasks:
+            task.cancel()
+        self.timers.clear()
+        self.pending.clear()
+
+    async def advance(self, ctx: commands.Context):
+        """Moves the watermark after the memorizer ran for a message some other way."""
+        channel_config = await self.cog.config.load_channel(ctx.channel)
+        if ctx.message.id > channel_config.last_memorized.value:
+            await channel_config.last_memorized.set(ctx.message.id)
+
+    async def run(self, pending: PendingMemorization):
+        ctx = pending.ctx
+        assert ctx.guild
+        async with self.locks.setdefault(ctx.channel.id, asyncio.Lock()):
+            config = self.cog.config[ctx.guild]
+            channel_config = await self.cog.config.load_channel(ctx.channel)
+            watermark = channel_config.last_memorized.value
+            if ctx.message.id <= watermark:
+                self.skipped += 1
+                return
+            backread = await self.cog.fetch_message_history(ctx)
+            max_messages = min(config.backread_messages.value, config.backread_short.value * pending.turns)
+            backread = [msg for msg in backread if msg.id > watermark][:max_messages]
+            if not any(not msg.author.bot for msg in backread):
+                self.skipped += 1
+                return await channel_config.last_memorized.set(ctx.message.id)
+            result = CompletionResult()
+            try:
+                messages = await self.cog.context_builder.build_context(ctx, backread, config, result, self.cog.encoding)
+                memory_names = list(self.cog.memory_store.get(ctx.guild.id).keys())
+                await self.cog.execute_memorizer(ctx, messages, memory_names, pending.recalled_memories_str, result,
+                                                 standalone=True, num_messages=len(backread))
+            except Exception:
+                log.exception(f"Memorizing {len(backread)} messages in {ctx.channel.id}")
+                return
+            self.runs += 1
+            self.turns += pending.turns
+            await channel_config.last_memorized.set(ctx.message.id)
+            log.info(f"Memorized {pending.turns} turns, {len(backread)} messages in {ctx.channel.id} {result}")
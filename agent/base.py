@@ -1,13 +1,23 @@
 import aiohttp
+import discord
 from datetime import datetime
 from openai import AsyncOpenAI
 from redbot.core import commands, Config
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
 
 import agent.defaults as defaults
 from agent.schema import CompletionResult, AgentImageContent
 from agent.config import ConfigField, CogConfig, CogConfigBase
-from agent.constants import DISCORD_EPOCH_DATETIME
+from agent.message_cache import MessageCache
+from agent.workers import WorkerPool
+from agent.url_cache import UrlCache
+from agent.image_cache import ImageCache
+from agent.memory_store import MemoryStore
+from agent.recall_cache import RecallCache
+from agent.trigger_filter import TriggerFilter
+from agent.member_index import MemberIndex
+from agent.constants import DISCORD_EPOCH_DATETIME, WORKER_PROCESSES, WORKER_QUEUE_SIZE, IMAGE_WORKER_PROCESSES, IMAGE_WORKER_QUEUE_SIZE
 
 
 class AgentCogGuildConfig(CogConfigBase):
@@ -18,7 +28,8 @@ class AgentCogGuildConfig(CogConfigBase):
     generation_channels:     ConfigField[list[int]]      = ConfigField([])
     auto_channel_mode:       ConfigField[str]            = ConfigField("whitelist")
     auto_channels:           ConfigField[list[int]]      = ConfigField([])
-    memory:                  ConfigField[dict[str, str]] = ConfigField({})
+    precaption_channel_mode: ConfigField[str]            = ConfigField("whitelist")
+    precaption_channels:     ConfigField[list[int]]      = ConfigField([])
     prompt_keys:             ConfigField[dict[str, str]] = ConfigField({})
     enabled_functions:       ConfigField[list[str]]      = ConfigField(defaults.ENABLED_FUNCTIONS)
     # LLM
@@ -36,6 +47,9 @@ class AgentCogGuildConfig(CogConfigBase):
     effort_recaller:         ConfigField[str] = ConfigField(defaults.EFFORT_RECALLER)
     effort_responder:        ConfigField[str] = ConfigField(defaults.EFFORT_RESPONDER)
     effort_memorizer:        ConfigField[str] = ConfigField(defaults.EFFORT_MEMORIZER)
+    recall_mode:             ConfigField[str] = ConfigField(defaults.RECALL_MODE)
+    recall_cache:            ConfigField[bool] = ConfigField(defaults.RECALL_CACHE)
+    stream_responses:        ConfigField[bool] = ConfigField(defaults.STREAM_RESPONSES)
     # Limits 
     response_tokens:         ConfigField[int] = ConfigField(defaults.RESPONSE_TOKENS)
     backread_tokens:         ConfigField[int] = ConfigField(defaults.BACKREAD_TOKENS)
@@ -48,6 +62,10 @@ class AgentCogGuildConfig(CogConfigBase):
     max_text_file:           ConfigField[int] = ConfigField(defaults.TEXT_FILE_LENGTH)
     max_image_resolution:    ConfigField[int] = ConfigField(defaults.IMAGE_SIZE)
     max_caption_resolution:  ConfigField[int] = ConfigField(defaults.CAPTION_SIZE)
+    caption_batch_size:      ConfigField[int] = ConfigField(defaults.CAPTION_BATCH_SIZE)
+    recall_top_k:            ConfigField[int] = ConfigField(defaults.RECALL_TOP_K)
+    lazy_images:             ConfigField[bool] = ConfigField(defaults.LAZY_IMAGES)
+    precaption_per_hour:     ConfigField[int] = ConfigField(defaults.PRECAPTION_PER_HOUR)
     # Memorizer
     allow_memorizer:         ConfigField[bool] = ConfigField(defaults.ALLOW_MEMORIZER)
     memorizer_user_only:     ConfigField[bool] = ConfigField(defaults.MEMORIZER_USER_ONLY)
@@ -61,8 +79,9 @@ class AgentCogGuildConfig(CogConfigBase):
 
 
 class AgentCogChannelConfig(CogConfigBase):
-    start: ConfigField[datetime]         = ConfigField(DISCORD_EPOCH_DATETIME)
+    start: ConfigField[datetime]         = ConfigField(DISCORD_EPOCH_DATETIME, durable=True)
     last_response: ConfigField[datetime] = ConfigField(DISCORD_EPOCH_DATETIME)
+    last_memorized: ConfigField[int]     = ConfigField(0)  # message id
     last_reaction: ConfigField[datetime] = ConfigField(DISCORD_EPOCH_DATETIME)
 
 
@@ -73,10 +92,13 @@ class AgentCogConfig(CogConfig[AgentCogGuildConfig, AgentCogChannelConfig]):
     extended_logging: ConfigField[bool]        = ConfigField(True)
     tool_settings: ConfigField[dict[str, str]] = ConfigField({})
     response_timeout: ConfigField[int]         = ConfigField(120)
+    tool_concurrency: ConfigField[int]         = ConfigField(4)
+    precaption_concurrency: ConfigField[int]   = ConfigField(1)
     slow_timer: ConfigField[int]               = ConfigField(30)
     slow_emoji: ConfigField[str]               = ConfigField("🤔")
     noresponse_emoji: ConfigField[str]         = ConfigField("🤐")
     blocked_emoji: ConfigField[str]            = ConfigField("❌")
+    memories_migrated: ConfigField[bool]       = ConfigField(False, durable=True)
 
 
 class AgentCogBase(commands.Cog):
@@ -89,14 +111,29 @@ class AgentCogBase(commands.Cog):
         self.openwebui_client: AsyncOpenAI | None = None
         self.currently_responding: set[int] = set()
         self.currently_generating: set[int] = set()
+        self.message_cache = MessageCache(bot)
+        self.worker_pool = WorkerPool("scrape", WORKER_PROCESSES, WORKER_QUEUE_SIZE)
+        self.image_pool = WorkerPool("image", IMAGE_WORKER_PROCESSES, IMAGE_WORKER_QUEUE_SIZE)
+        self.url_cache = UrlCache()
+        self.image_cache = ImageCache(cog_data_path(self) / "image_cache")
+        self.memory_store = MemoryStore(cog_data_path(self) / "memories.db")
+        self.recall_cache = RecallCache()
+        self.trigger_filter = TriggerFilter()
+        self.member_index = MemberIndex()
         self.config = AgentCogConfig(Config.get_conf(None, identifier=19475820, cog_name="GptMemory"))
         self.config.register_all()
         
+    async def fetch_message_history(self, ctx: commands.Context, short: bool = False, limit: int | None = None, ignore_start: bool = False) -> list[discord.Message]:
+        raise NotImplementedError()
+
     async def find_last_sd_generated_image_resolution(self, ctx: commands.Context) -> tuple[int | None, int | None]:
         raise NotImplementedError()
     
     async def execute_captioner(self, ctx: commands.Context, image: AgentImageContent, result: CompletionResult) -> str:
         raise NotImplementedError()
+
+    async def execute_batch_captioner(self, ctx: commands.Context, images: list[AgentImageContent], result: CompletionResult) -> list[str | None]:
+        raise NotImplementedError()
     
     def is_busy(self, message_id):
         return message_id in self.currently_responding or message_id in self.currently_generating
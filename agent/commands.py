@@ -1,7 +1,6 @@
 import io
 import discord
 from typing import Optional
-from difflib import get_close_matches
 from redbot.core import commands
 
 from agent.base import AgentCogBase, AgentCogGuildConfig
@@ -133,18 +132,16 @@ class AgentCogCommands(AgentCogBase):
         if isinstance(name, discord.Member):
             name = name.name
         assert ctx.guild
-        memory = self.config[ctx.guild].memory.value
+        memory = self.memory_store.get(ctx.guild.id)
         if not name:
             if memory:
-                view = MemoryListView(list(memory.keys()))
+                view = MemoryListView(list(memory.keys()), self.member_index.names(ctx.guild))
                 view.message = await ctx.send(view=view)
             else:
                 await ctx.send("No memories...", delete_after=60)
         elif memory:
             if name not in memory:
-                matches = get_close_matches(name, memory)
-                if matches:
-                    name = matches[0]
+                name = self.memory_store.closest(ctx.guild.id, name) or name
             if name in memory:
                 view = MemoryInfoView(name, memory[name])
                 view.message = await ctx.send(view=view)
@@ -158,15 +155,16 @@ class AgentCogCommands(AgentCogBase):
     @commands.guild_only()
     async def command_deletememory(self, ctx: commands.Context, *, name: str):
         """Delete an LLM memory"""
-        if (memory := self.config[ctx.guild].memory.value) and name in memory:
+        assert ctx.guild
+        if (memory := self.memory_store.get(ctx.guild.id)) and name in memory:
             before = memory[name]
             del memory[name]
-            await self.config[ctx.guild].memory.save()
-            view = MemoryChangeView([MemoryChangeResult(name, before, None)], standalone=True)
+            changes = [MemoryChangeResult(name, before, None)]
+            await self.memory_store.save(ctx.guild.id, changes, f"command:{ctx.author.id}")
+            view = MemoryChangeView(changes, standalone=True)
             view.message = await ctx.send(view=view)
         else:
             await ctx.send(f"No memory of `{name}`", delete_after=60)
-        assert ctx.guild
         if ctx.channel.permissions_for(ctx.guild.me).manage_messages:
             await ctx.message.delete()
 
@@ -180,12 +178,26 @@ class AgentCogCommands(AgentCogBase):
             return await ctx.send("Invalid name")
         if len(name) > 1000:
             return await ctx.send("Name too long")
-        memory = self.config[ctx.guild].memory.value
+        assert ctx.guild
+        memory = self.memory_store.get(ctx.guild.id)
         before = memory.get(name)
         memory[name] = content
-        await self.config[ctx.guild].memory.save()
-        view = MemoryChangeView([MemoryChangeResult(name, before, content)], standalone=True)
+        changes = [MemoryChangeResult(name, before, content)]
+        await self.memory_store.save(ctx.guild.id, changes, f"command:{ctx.author.id}")
+        view = MemoryChangeView(changes, standalone=True)
         view.message = await ctx.send(view=view)
-        assert ctx.guild
         if ctx.channel.permissions_for(ctx.guild.me).manage_messages:
             await ctx.message.delete()
+
+    @commands.command(name="memoryhistory") # type: ignore
+    @commands.has_permissions(manage_guild=True)
+    @commands.guild_only()
+    async def command_memoryhistory(self, ctx: commands.Context, *, name: str):
+        """View the latest changes to an LLM memory"""
+        assert ctx.guild
+        history = await self.memory_store.history(ctx.guild.id, name, 10)
+        if not history:
+            return await ctx.send(f"No history of `{name}`", delete_after=60)
+        content = "\n".join(f"`{i+1}.` <t:{int(changed_at)}:R> {source}" for i, (_, _, source, changed_at) in enumerate(history))
+        view = MemoryChangeView([MemoryChangeResult(f"{i+1}. {name}"[:80], before, after) for i, (before, after, _, _) in enumerate(history)], standalone=True)
+        view.message = await ctx.send(content, view=view)
@@ -1,11 +1,13 @@
+import asyncio
 import discord
-from copy import deepcopy
+import logging
+from copy import copy
 from datetime import datetime
-from typing import Any, Generic, Self, TypeVar, overload
+from typing import Any, Callable, Generic, Self, TypeVar, overload
 from redbot.core import Config
-from redbot.core.bot import Red
 from redbot.core.config import Group
 
+log = logging.getLogger("agent.config")
 
 T = TypeVar("T")
 
@@ -13,18 +15,31 @@ class ConfigField(Generic[T]):
     """
     Represents a cached config value that may also be saved back to disk asynchronously.
     Before the parent config is initialized, the value will be the default value for this field.
+    While the parent config is in write-behind mode, saves only happen on its next flush,
+    unless the field is durable.
+    Fields declared on a config class are templates, each config instance gets its own bound copies.
     """
-    def __init__(self, default: T):
+    __slots__ = ("_value", "_name", "_durable", "_owner")
+
+    def __init__(self, default: T, durable: bool = False):
         self._value = default
-        self._group: Config | Group | None = None
         self._name = ""
-        self._loaded = False
+        self._durable = durable
+        self._owner: "CogConfigBase | None" = None
+
+    def __set_name__(self, owner: type, name: str):
+        self._name = name
 
     @property
     def name(self) -> str:
         """The internal name of this field"""
         return self._name
 
+    @property
+    def owner(self) -> "CogConfigBase | None":
+        """The config instance this field belongs to"""
+        return self._owner
+
     @property
     def value(self) -> T:
         """The value of this field in memory."""
@@ -32,61 +47,79 @@ class ConfigField(Generic[T]):
 
     async def set(self, value: T) -> None:
         """Changes the value of this field in memory and saves it to disk."""
-        if not self._group or not self._loaded:
+        if not self._owner or not self._owner._group:
             raise RuntimeError("Config has not been loaded")
         self._value = value
-        await self._group.__getattr__(self._name).set(self._raw_value())
+        await self.save()
 
     async def save(self) -> None:
         """Saves the value of this field to disk, useful when a mutable value has been recently changed in memory."""
-        if not self._group or not self._loaded:
+        if not self._owner or not self._owner._group:
             raise RuntimeError("Config has not been loaded")
-        await self._group.__getattr__(self._name).set(self._raw_value())
+        writer = self._owner._writer
+        if writer:
+            writer.changed(self)
+        if writer and writer.write_behind and not self._durable:
+            writer.mark_dirty(self)
+        else:
+            await self._write()
+
+    async def _write(self) -> None:
+        assert self._owner and self._owner._group
+        await self._owner._group.__getattr__(self._name).set(self._raw_value())
 
     def _raw_value(self) -> Any:
         if isinstance(self.value, datetime):
             return self.value.isoformat()
         return self.value
-    
-    def _load_raw_value(self, value: T) -> None:
-        if type(self._value) is datetime and isinstance(value, str):
-            self._value = datetime.fromisoformat(value)
+
+    def _bind(self, owner: "CogConfigBase", values: dict[str, Any]) -> "ConfigField[T]":
+        """Creates the copy of this field for a config instance, with its loaded value or a copy of the default."""
+        field = object.__new__(ConfigField)
+        field._name = self._name
+        field._durable = self._durable
+        field._owner = owner
+        if self._name not in values:
+            field._value = copy(self._value)  # only lists and dicts are mutable here
+        elif type(self._value) is datetime and isinstance(values[self._name], str):
+            field._value = datetime.fromisoformat(values[self._name])
         else:
-            self._value = value
+            field._value = values[self._name]
+        return field
 
 
 class CogConfigBase:
     """
     Base class for a group of config fields.
     """
-    def __init__(self, values: dict[str, Any], group: Config | Group | None = None):
-        self._init_fields(values, group)
-
-    def _init_fields(self, values: dict[str, Any], group: Config | Group | None = None):
-        for name, field in vars(type(self)).items():
-            if isinstance(field, ConfigField):
-                new_field = deepcopy(field)
-                object.__setattr__(self, name, new_field)
-                new_field._loaded = True
-                new_field._group = group
-                new_field._name = name
-                if name in values:
-                    new_field._load_raw_value(values[name])
+    _fields: tuple[ConfigField, ...] = ()
+    _group: Config | Group | None = None
+    _writer: "CogConfig | None" = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(field for field in vars(cls).values() if isinstance(field, ConfigField))
+
+    def __init__(self, values: dict[str, Any], group: Config | Group | None = None, writer: "CogConfig | None" = None):
+        self._init_fields(values, group, writer)
+
+    def _init_fields(self, values: dict[str, Any], group: Config | Group | None = None, writer: "CogConfig | None" = None):
+        self._group = group
+        self._writer = writer
+        fields = self.__dict__
+        for field in self._fields:
+            fields[field._name] = field._bind(self, values)
 
     @classmethod
-    async def load(cls, group: Config | Group) -> Self:
+    async def load(cls, group: Config | Group, writer: "CogConfig | None" = None) -> Self:
         """Creates an instance of this class, loading its values from disk."""
         values = await group.all()
-        return cls(values, group)
+        return cls(values, group, writer)
 
     @classmethod
     def defaults(cls) -> dict:
         """Returns a dictionary of the field names and field default values of this class."""
-        return {
-            name: field._raw_value()
-            for name, field in vars(cls).items()
-            if isinstance(field, ConfigField)
-        }
+        return {field.name: field._raw_value() for field in cls._fields}
 
 
 GuildT = TypeVar("GuildT", bound=CogConfigBase)
@@ -96,6 +129,8 @@ class CogConfig(CogConfigBase, Generic[GuildT, ChannelT]):
     """
     Represents a cached copy of all cog configuration,
     with dynamically-defined type-hinted fields that may also be saved back to disk asynchronously.
+    In write-behind mode, changed fields are collected and saved together on an interval,
+    so that frequent changes to the same field only cause one write.
     """
     _guild_type: type[GuildT]
     _channel_type: type[ChannelT]
@@ -104,34 +139,87 @@ class CogConfig(CogConfigBase, Generic[GuildT, ChannelT]):
 
     def __init__(self, config: Config):
         self._config = config
+        self.guild = {}
+        self.channel = {}
+        self._dirty: dict[int, ConfigField] = {}  # by id, fields aren't hashable by value
+        self._flush_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.write_behind = False
+        self.listeners: list[Callable[[ConfigField], None]] = []
+        self.deferred_writes = 0
+        self.flushed_writes = 0
+
+    def start_write_behind(self, interval: float):
+        """Defers saving fields that aren't durable, until the next flush."""
+        if self._flush_task:
+            self._flush_task.cancel()
+        self.write_behind = True
+        self._flush_task = asyncio.create_task(self._flush_periodically(interval))
+
+    async def stop_write_behind(self):
+        """Saves every pending change and goes back to saving immediately."""
+        self.write_behind = False
+        if self._flush_task:
+            async with self._flush_lock:  # waits for a flush in progress instead of cancelling it mid-write
+                self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def changed(self, field: ConfigField):
+        """Notifies listeners that a field was changed, before it's saved."""
+        for listener in self.listeners:
+            listener(field)
+
+    def mark_dirty(self, field: ConfigField):
+        self.deferred_writes += 1
+        self._dirty[id(field)] = field
+
+    async def flush(self):
+        """
+        Saves every field that changed since the last flush.
+        A field stays dirty until its write succeeds, and fields changed again while being written are saved on the next flush.
+        """
+        async with self._flush_lock:
+            for key in list(self._dirty):
+                field = self._dirty.pop(key, None)
+                if field is None:
+                    continue
+                try:
+                    await field._write()
+                    self.flushed_writes += 1
+                except asyncio.CancelledError:
+                    self._dirty.setdefault(key, field)
+                    raise
+                except Exception:
+                    self._dirty.setdefault(key, field)
+                    log.exception(f"Saving config field {field.name}")
+
+    async def _flush_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    @property
+    def raw(self) -> Config:
+        """The underlying Red config, for values that aren't fields."""
+        return self._config
 
-    async def load_all(self, bot: Red):
-        """Loads all cog configuration into memory."""
-        self._init_fields(await self._config.all(), self._config)
-        self.guild = {
-            guild_id: self._guild_type(values, self._config.guild(guild))
-            for guild_id, values in (await self._config.all_guilds()).items()
-            if (guild := bot.get_guild(guild_id))
-        }
-        self.channel = {
-            channel_id: self._channel_type(values, self._config.channel(channel))
-            for channel_id, values in (await self._config.all_channels()).items()
-            if (channel := bot.get_channel(channel_id))
-            and isinstance(channel, (discord.TextChannel, discord.Thread))
-        }
+    async def load_global(self):
+        """Loads the global configuration into memory. Guild and channel configuration is loaded on first use."""
+        self._init_fields(await self._config.all(), self._config, self)
 
     async def load_guild(self, guild: discord.Guild) -> GuildT:
-        """Loads a single guild config into memory."""
+        """Loads a single guild config into memory, if it wasn't already."""
         if guild.id not in self.guild:
-            self.guild[guild.id] = await self._guild_type.load(self._config.guild(guild))
+            self.guild[guild.id] = await self._guild_type.load(self._config.guild(guild), self)
         return self.guild[guild.id]
     
     async def load_channel(self, channel: discord.abc.Messageable) -> ChannelT:
-        """Loads a single channel config into memory."""
+        """Loads a single channel config into memory, if it wasn't already."""
         if not isinstance(channel, (discord.abc.GuildChannel, discord.Thread)):
             raise ValueError("Invalid channel for config")
         if channel.id not in self.channel:
-            self.channel[channel.id] = await self._channel_type.load(self._config.channel(channel))
+            self.channel[channel.id] = await self._channel_type.load(self._config.channel(channel), self)
         return self.channel[channel.id]
     
     def register_all(self):
@@ -147,9 +235,19 @@ class CogConfig(CogConfigBase, Generic[GuildT, ChannelT]):
     def __getitem__(self, key: discord.abc.Messageable | None) -> ChannelT: ...
 
     def __getitem__(self, key):
+        """
+        Gets a loaded guild or channel config. If it wasn't loaded, returns one with default values that isn't kept,
+        so that loading it later still finds the values on disk.
+        """
         if isinstance(key, discord.Guild):
-            return self.guild.get(key.id) or self.guild.setdefault(key.id, self._guild_type({}, self._config.guild(key)))
+            if config := self.guild.get(key.id):
+                return config
+            log.warning(f"Config for guild {key.id} was used before being loaded")
+            return self._guild_type({}, self._config.guild(key), self)
         if isinstance(key, discord.abc.Messageable):  # messageable is more useful for type checks
             assert isinstance(key, discord.abc.GuildChannel | discord.Thread)
-            return self.channel.get(key.id) or self.channel.setdefault(key.id, self._channel_type({}, self._config.channel(key)))
+            if config := self.channel.get(key.id):
+                return config
+            log.warning(f"Config for channel {key.id} was used before being loaded")
+            return self._channel_type({}, self._config.channel(key), self)
         raise TypeError(f"Invalid key {key}")
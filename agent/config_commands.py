@@ -5,7 +5,7 @@ from redbot.core import commands
 
 from agent.base import AgentCogBase
 from agent.config import ConfigField
-from agent.constants import EFFORT_VALUES, VISION_MODELS
+from agent.constants import EFFORT_VALUES, VISION_MODELS, RECALL_MODES
 from agent.tools.base import get_all_tools
 
 
@@ -40,11 +40,13 @@ class AgentCogConfigCommands(AgentCogBase):
         response += " ".join([f"<#{cid}>" for cid in config.channels.value])
         response += "\n`[whitelisted_auto_channels:]` " if config.auto_channel_mode.value == "whitelist" else "\n`[blacklisted_auto_channels:]` " 
         response += " ".join([f"<#{cid}>" for cid in config.auto_channels.value])
+        response += "\n`[whitelisted_precaption_channels:]` " if config.precaption_channel_mode.value == "whitelist" else "\n`[blacklisted_precaption_channels:]` " 
+        response += " ".join([f"<#{cid}>" for cid in config.precaption_channels.value])
         if "generate_stable_diffusion" in functions:
             response += "\n`[whitelisted_generation_channels:]` " if config.generation_channel_mode.value == "whitelist" else "\n`[blacklisted_generation_channels:]` " 
             response += " ".join([f"<#{cid}>" for cid in config.generation_channels.value])
-        response += f"\n`[model_recaller:]` {config.model_recaller.value} `[effort_recaller:]` {config.effort_recaller.value}"
-        response += f"\n`[model_responder:]` {config.model_responder.value} `[effort_responder:]` {config.effort_responder.value}"
+        response += f"\n`[model_recaller:]` {config.model_recaller.value} `[effort_recaller:]` {config.effort_recaller.value} `[recall_mode:]` {config.recall_mode.value} `[recall_cache:]` {config.recall_cache.value}"
+        response += f"\n`[model_responder:]` {config.model_responder.value} `[effort_responder:]` {config.effort_responder.value} `[stream_responses:]` {config.stream_responses.value}"
         response += f"\n`[model_memorizer:]` {config.model_memorizer.value} `[effort_memorizer:]` {config.effort_memorizer.value}"
         response += f"\n`[allow_memorizer:]` {config.allow_memorizer.value} `[memorizer_alerts:]` {config.memorizer_alerts.value} `[memorizer_user_only:]` {config.memorizer_user_only.value}"
         response += f"\n`[tools:]` {' / '.join(functions)}" 
@@ -52,12 +54,49 @@ class AgentCogConfigCommands(AgentCogBase):
         response += f"\n`[response_tokens:]` {config.response_tokens.value} `[backread_tokens:]` {config.backread_tokens.value}"
         response += f"\n`[backread_messages:]` {config.backread_messages.value} `[backread_short:]` {config.backread_short.value}"
         response += f"\n`[max_images:]` {config.max_images.value} `[max_image_resolution:]` {config.max_image_resolution.value}"
+        response += f"\n`[lazy_images:]` {config.lazy_images.value} `[precaption_per_hour:]` {config.precaption_per_hour.value} `[caption_batch_size:]` {config.caption_batch_size.value}"
         response += f"\n`[max_tool:]` {config.max_tool.value} `[max_tool_depth:]` {config.max_tool_depth.value}"
+        response += f"\n`[recall_top_k:]` {config.recall_top_k.value}"
         response += f"\n`[max_quote:]` {config.max_quote.value} `[max_text_file:]` {config.max_text_file.value}"
 
         await ctx.send(response)
 
 
+    @agentconfig.command(name="stats", aliases=["cache"])
+    async def agentconfig_stats(self, ctx: commands.Context):
+        """View cache statistics, for the developer."""
+        message_cache = self.message_cache
+        response = ">>> # Agent Cog Stats"
+        response += f"\n`[message_cache:]` {message_cache.hits} hits / {message_cache.misses} misses ({message_cache.hit_ratio:.1%})"
+        response += f" `[channels:]` {len(message_cache.buffers)}"
+        url_cache = self.url_cache
+        response += f"\n`[url_cache:]` {url_cache.hits} hits / {url_cache.revalidations} revalidated / {url_cache.misses} misses ({url_cache.hit_ratio:.1%})"
+        response += f" `[urls:]` {len(url_cache.entries)} `[size:]` {url_cache.size / 1_000_000:.1f}M chars"
+        trigger_filter = self.trigger_filter
+        response += f"\n`[trigger_filter:]` {trigger_filter.rejected} rejected / {trigger_filter.checked} checked ({trigger_filter.rejection_ratio:.1%})"
+        response += f" `[guilds:]` {len(trigger_filter.guilds)}"
+        response += f"\n`[config_writes:]` {self.config.deferred_writes} deferred / {self.config.flushed_writes} flushed"
+        recall_cache = self.recall_cache
+        response += f"\n`[recall_cache:]` {recall_cache.hits} hits / {recall_cache.misses} misses ({recall_cache.hit_ratio:.1%})"
+        response += f" `[channels:]` {len(recall_cache.entries)}"
+        precaptioner = getattr(self, "precaptioner", None)
+        if precaptioner:
+            response += f"\n`[precaptioner:]` {precaptioner.captioned} captioned / {precaptioner.dropped} dropped `[queued:]` {precaptioner.queue.qsize()}"
+        background_memorizer = getattr(self, "background_memorizer", None)
+        if background_memorizer:
+            response += f"\n`[memorizer:]` {background_memorizer.runs} runs / {background_memorizer.turns} turns / {background_memorizer.skipped} skipped"
+            response += f" `[pending:]` {len(background_memorizer.pending)}"
+        context_builder = getattr(self, "context_builder", None)
+        if context_builder and context_builder.deferred_captions:
+            average_ms = context_builder.deferred_caption_ms // context_builder.deferred_captions
+            response += f"\n`[deferred_captions:]` {context_builder.deferred_captions} `[latency_removed:]` {context_builder.deferred_caption_ms / 1000:.1f}s total, {average_ms}ms average"
+        image_cache = self.image_cache
+        response += f"\n`[caption_cache:]` {image_cache.caption_hits} hits / {image_cache.caption_misses} misses ({image_cache.caption_hit_ratio:.1%})"
+        response += f"\n`[image_cache:]` {image_cache.image_hits} hits / {image_cache.image_misses} misses ({image_cache.image_hit_ratio:.1%})"
+        response += f" `[entries:]` {len(image_cache.entries)} `[size:]` {image_cache.size / 1_000_000:.1f}/{image_cache.max_size / 1_000_000:.0f} MB"
+        await ctx.send(response)
+
+
     @staticmethod
     async def bool_config_command(ctx: commands.Context, field: ConfigField[bool], value: bool | None):
         if value is None:
@@ -119,6 +158,16 @@ class AgentCogConfigCommands(AgentCogBase):
         """Toggles logging mode, for the developer."""
         await self.bool_config_command(ctx, self.config.extended_logging, value)
     
+    @agentconfig.command(name="recall_cache")
+    async def agentconfig_recall_cache(self, ctx: commands.Context, value: Optional[bool]):
+        """Whether consecutive responses in a channel will reuse recalled memories while the recaller refreshes them in the background."""
+        await self.bool_config_command(ctx, self.config[ctx.guild].recall_cache, value)
+
+    @agentconfig.command(name="stream_responses", aliases=["stream"])
+    async def agentconfig_stream_responses(self, ctx: commands.Context, value: Optional[bool]):
+        """Whether responses will be shown in chat while they're being written, by editing the message."""
+        await self.bool_config_command(ctx, self.config[ctx.guild].stream_responses, value)
+
     @agentconfig.command(name="allow_memorizer", aliases=["enable_memorizer"])
     async def agentconfig_allow_memorizer(self, ctx: commands.Context, value: Optional[bool]):
         """Whether the memorizer will run at all, editing memories."""
@@ -164,6 +213,18 @@ class AgentCogConfigCommands(AgentCogBase):
         """Sets how long a response can take before it's cancelled"""
         await self.integer_config_command(ctx, self.config.response_timeout, 10, 3600, value, "seconds")
     
+    @agentconfig.command(name="tool_concurrency")
+    async def agentconfig_tool_concurrency(self, ctx: commands.Context, value: Optional[int]):
+        """Sets how many tools requested at once by the responder can run at the same time."""
+        await self.integer_config_command(ctx, self.config.tool_concurrency, 1, 10, value, "tools")
+
+    @agentconfig.command(name="precaption_concurrency")
+    async def agentconfig_precaption_concurrency(self, ctx: commands.Context, value: Optional[int]):
+        """Sets how many images can be captioned in the background at the same time."""
+        await self.integer_config_command(ctx, self.config.precaption_concurrency, 1, 5, value, "images")
+        if value is not None:
+            await getattr(self, "precaptioner").start(value)
+
     @agentconfig.command(name="slow_timer")
     async def agentconfig_slow_timer(self, ctx: commands.Context, value: Optional[int]):
         """Sets how long a response can take before reacting with slow_emoji"""
@@ -215,6 +276,29 @@ class AgentCogConfigCommands(AgentCogBase):
         """How many images to send to the LLM in full with each response; the rest will be captioned and stored instead."""
         await self.integer_config_command(ctx, self.config[ctx.guild].max_images, 0, 100, value)
 
+    @agentconfig_limits.command(name="lazy_images")
+    async def agentconfig_lazy_images(self, ctx: commands.Context, value: Optional[bool]):
+        """If enabled, images are only downloaded and captioned for messages that fit in backread_tokens."""
+        await self.bool_config_command(ctx, self.config[ctx.guild].lazy_images, value)
+
+    @agentconfig_limits.command(name="recall_top_k")
+    async def agentconfig_recall_top_k(self, ctx: commands.Context, value: Optional[int]):
+        """How many memories can be recalled by the local index, in local and rerank recall modes."""
+        config = self.config[ctx.guild]
+        await self.integer_config_command(ctx, config.recall_top_k, 1, 50, value, "memories")
+
+    @agentconfig_limits.command(name="caption_batch_size")
+    async def agentconfig_caption_batch_size(self, ctx: commands.Context, value: Optional[int]):
+        """How many images can be captioned in a single request, 1 to disable batching."""
+        config = self.config[ctx.guild]
+        await self.integer_config_command(ctx, config.caption_batch_size, 1, 10, value, "images")
+
+    @agentconfig_limits.command(name="precaption_per_hour")
+    async def agentconfig_precaption_per_hour(self, ctx: commands.Context, value: Optional[int]):
+        """How many messages with images can be captioned in the background per hour, in precaption channels."""
+        config = self.config[ctx.guild]
+        await self.integer_config_command(ctx, config.precaption_per_hour, 0, 1000, value, "messages")
+
     @agentconfig_limits.command(name="max_depth", aliases=["max_tool_depth"])
     async def agentconfig_max_tool_depth(self, ctx: commands.Context, value: Optional[int]):
         """How many tools the AI can use one after the other. Each consecutive tool call is more expensive than the last."""
@@ -344,6 +428,38 @@ class AgentCogConfigCommands(AgentCogBase):
 
 
 
+    @agentconfig.group(name="precaption_channels")
+    async def agentconfig_precaption_channels(self, ctx: commands.Context):
+        """Shows or sets the channels where images are captioned in the background as they're posted."""
+
+    @agentconfig_precaption_channels.command("list", aliases=["show", "view"])
+    async def agentconfig_precaption_channels_list(self, ctx: commands.Context):
+        """Shows the precaption channel whitelist or blacklist depending on the current setting."""
+        config = self.config[ctx.guild]
+        await self.channels_config_command(ctx, config.precaption_channels, config.precaption_channel_mode, None, None)
+
+    @agentconfig_precaption_channels.command("set")
+    async def agentconfig_precaption_channels_set(self, ctx: commands.Context, mode: ChannelMode, channels: commands.Greedy[discord.TextChannel | discord.Thread]):
+        """Sets a new whitelist or blacklist for precaption channels"""
+        config = self.config[ctx.guild]
+        await self.channels_config_command(ctx, config.precaption_channels, config.precaption_channel_mode, set(c.id for c in channels), mode)
+
+    @agentconfig_precaption_channels.command("add")
+    async def agentconfig_precaption_channels_add(self, ctx: commands.Context, channels: commands.Greedy[discord.TextChannel | discord.Thread]):
+        """Adds channels to the precaption whitelist or blacklist depending on the current setting."""
+        config = self.config[ctx.guild]
+        channel_ids = set([c.id for c in channels] + config.precaption_channels.value)
+        await self.channels_config_command(ctx, config.precaption_channels, config.precaption_channel_mode, channel_ids, None)
+
+    @agentconfig_precaption_channels.command("remove")
+    async def agentconfig_precaption_channels_remove(self, ctx: commands.Context, channels: commands.Greedy[discord.TextChannel | discord.Thread]):
+        """Removes channels from the precaption whitelist or blacklist depending on the current setting."""
+        config = self.config[ctx.guild]
+        channel_ids = set(config.precaption_channels.value) - set(c.id for c in channels)
+        await self.channels_config_command(ctx, config.precaption_channels, config.precaption_channel_mode, channel_ids, None)
+
+
+
     @agentconfig.group(name="tool", aliases=["function", "functions", "tools"])
     async def agentconfig_functions(self, _: commands.Context):
         """List or toggle function calls used by the responder."""
@@ -439,6 +555,24 @@ class AgentCogConfigCommands(AgentCogBase):
             else:
                 await ctx.tick(message="Model changed")
 
+    @agentconfig.command("recall_mode")
+    async def agentconfig_recall_mode(self, ctx: commands.Context, mode: Optional[str]):
+        """
+        Views or changes how memories are recalled before responding.
+        `llm`: the recaller is shown every memory name.
+        `local`: memories are searched locally without an LLM call.
+        `rerank`: the best local matches are shown to the recaller.
+        """
+        config = self.config[ctx.guild]
+        if not mode or not mode.strip():
+            await ctx.reply(f"`[{config.recall_mode.name}:]` {config.recall_mode.value}", mention_author=False)
+        elif mode.strip().lower() not in RECALL_MODES:
+            await ctx.reply("Invalid value!\nValid values are " + ",".join([f"`{m}`" for m in RECALL_MODES]))
+        else:
+            await config.recall_mode.set(mode.strip().lower())
+            await ctx.tick(message="Recall mode changed")
+
+
     EffortPromptTypes = Literal["recaller", "responder", "memorizer"]
 
     @agentconfig.command("effort")
@@ -12,6 +12,50 @@ DATETIME_FORMATTING = "%Y-%m-%d %H:%M:%S %Z%z"
 TOKEN_ENCODING = "o200k_base"
 PERMANENT_PROMPT_TYPES = ("responder", "autoresponder", "autoreacter", "recaller", "captioner", "memorizer")
 MAX_IMAGES_PER_MESSAGE = 4
+IMAGE_TOKENS = 1120  # estimate for a full detail image
+STREAM_EDIT_INTERVAL = 1.5  # seconds, stays under the message edit rate limit
+MESSAGE_CACHE_SIZE = 150  # above the backread_messages limit
+MESSAGE_CACHE_FILL = 100  # a single page of channel history, or the backread limit and the trigger if larger
+MESSAGE_CACHE_CHANNELS = 200
+MESSAGE_CACHE_MAX_AGE = 6 * 60 * 60
+PARSED_MESSAGE_CACHE_SIZE = 100  # per channel, the backread_messages limit
+WORKER_PROCESSES = 2
+WORKER_QUEUE_SIZE = 16
+IMAGE_WORKER_PROCESSES = 2  # separate from the other workers so that slow images can't hold up scraping
+IMAGE_WORKER_QUEUE_SIZE = 16
+IMAGE_PROCESSING_TIMEOUT = 30
+IMAGE_MAX_BYTES = 400_000  # per encoded image sent to the model
+IMAGE_QUALITY_STEPS = (85, 75, 60)
+IMAGE_GRAPHIC_MAX_COLORS = 2048  # in a 128x128 sample, more than this is considered a photo
+IMAGE_CACHE_MAX_SIZE = 200 * 1024 * 1024  # bytes on disk
+IMAGE_CACHE_SAVE_DELAY = 60
+IMAGE_CACHE_URL_TTL = 24 * 60 * 60  # content behind a url may change, unlike attachments
+PRECAPTION_QUEUE_SIZE = 50
+PRECAPTION_BUSY_LIMIT = 3  # responses in progress
+PRECAPTION_TIMEOUT = 60
+TOOL_TIMEOUT_MARGIN = 10  # seconds left for the responder to answer after a tool times out, before response_timeout
+CAPTION_BATCH_WINDOW = 0.3  # seconds to wait for more images before sending a batch
+RECALL_MODES = ("llm", "local", "rerank")
+RECALL_RERANK_FACTOR = 4  # candidates shown to the recaller per recalled memory in rerank mode
+RECALL_CACHE_CHANNELS = 200
+RECALL_CACHE_MAX_AGE = 10 * 60  # seconds before a cached recall must be redone
+RECALL_CACHE_MAX_NEW_MESSAGES = 4  # messages sent since the cached recall
+MEMORIZER_QUIET_PERIOD = 120  # seconds without a response before memorizing a channel
+MEMORIZER_BATCH_TURNS = 5  # responses after which a channel is memorized anyway
+CONFIG_FLUSH_INTERVAL = 15  # seconds between saves of changed config fields
+CAPTION_BATCH_INSTRUCTIONS = """
+
+You will receive {0} numbered images at once. Caption each of them independently, in the same order, \
+returning one caption per image along with its number.\
+"""
+SCRAPE_MAX_BYTES = 2 * 1024 * 1024  # read from the response body
+SCRAPE_MAX_HTML = 1_000_000  # characters given to the extractor
+SCRAPE_EXTRACTION_TIMEOUT = 5
+URL_CACHE_MAX_SIZE = 5_000_000  # characters
+URL_CACHE_TTL = 10 * 60  # before revalidating
+URL_CACHE_MAX_AGE = 24 * 60 * 60
+BOORU_TAGS_FUZZY_LIMIT = 50
+PROXY_RESIZE_TYPES = ("image/png", "image/jpeg", "image/webp")  # not animated
 
 RESPONSE_CLEANUP_PATTERNS = [
     #("Opening XML",       re.compile(r"^\s*<chat_message(?: [^>]+)?>\s*<content>\s*", re.DOTALL | re.IGNORECASE), ""),
@@ -37,6 +81,8 @@ GENERATE_IMAGE_PATTERNS = [
     ("XML object",        re.compile(r"<(\w+)(?: [^>]+)?>(?:(?!</\1>).)*<prompt>(.*?)</prompt>(?:(?!</\1>).)*</\1>", re.DOTALL | re.IGNORECASE)),
     #"JSON object":       re.compile(r"""{\s*(?:["']action["'].+?)?["']prompt["']:\s*["']([^"']+)["'].*$""", re.DOTALL | re.IGNORECASE),
 ]
+OPENING_XML_PATTERN = re.compile(r"^\s*(?:<chat_message(?: [^>]+)?>\s*)?(?:<content>\s*)?", re.IGNORECASE)
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"[.!?…](?=\s)|\n")
 EMOTE_PATTERN = re.compile(r"<(a?):(\w+):(\d{17,19})>")
 INCOMPLETE_EMOTE_PATTERN = re.compile(r"`?\\?(?:&lt;|<)?(a?):(\w{3,}):(\d*)(?:&gt;|>)?`?")
 FAKE_EMOTE_PATTERN = re.compile(r"(?:^|\s+):\w+:(?:\s+|$)")
@@ -1,5 +1,7 @@
+import time
 import logging
 import asyncio
+import aiohttp
 import discord
 import tiktoken
 import xmltodict
@@ -12,7 +14,7 @@ from agent import utils as utils
 from agent import constants as constants
 from agent.base import AgentCogBase, AgentCogGuildConfig
 from agent.schema import AgentImageContent, CompletionResult, AgentMessage, ImageSource, ParsedMessageResult, StructuredObject
-from agent.schema import DiscordMessageImageCandidates, DiscordMessageResolvedImages
+from agent.schema import DiscordMessageImageCandidates, DiscordMessageResolvedImages, CachedParsedMessage
 
 log = logging.getLogger("agent.context")
 
@@ -22,7 +24,10 @@ class ContextBuilder:
         self.bot = cog.bot
         self.config = cog.config
         self.session = cog.session
+        self.image_pool = cog.image_pool
+        self.image_cache = cog.image_cache
         self.execute_captioner = cog.execute_captioner
+        self.execute_batch_captioner = cog.execute_batch_captioner
         self.is_busy = cog.is_busy
         self.attachment_image_cache: dict[int, tuple[int, bytes]]  = ExpiringDict(max_len=25, max_age_seconds=24*60*60)
         self.url_image_cache: dict[str, bytes]                     = ExpiringDict(max_len=25, max_age_seconds=24*60*60)
@@ -30,6 +35,42 @@ class ContextBuilder:
         self.url_caption_cache: dict[str, str]                     = ExpiringDict(max_len=200, max_age_seconds=24*60*60)
         self.quote_lock: dict[int, asyncio.Lock]                   = ExpiringDict(max_len=25, max_age_seconds=120)
         self.url_lock: dict[str, asyncio.Lock]                     = ExpiringDict(max_len=25, max_age_seconds=120)
+        self.parsed_message_cache: dict[int, dict[int, CachedParsedMessage]] = ExpiringDict(max_len=constants.MESSAGE_CACHE_CHANNELS, max_age_seconds=60*60)
+        self.pending_captions: dict[str, asyncio.Task[str | None]] = {}
+        self.deferred_captions = 0
+        self.deferred_caption_ms = 0  # captioner latency removed from responses
+
+    def caption_in_background(self, ctx: commands.Context, src: ImageSource, cache_key: str, digest: str | None, data: bytes, thumbnail_size: int):
+        if cache_key in self.pending_captions:
+            return
+        task = asyncio.create_task(self.caption_and_store(ctx, src, cache_key, digest, data, thumbnail_size))
+        self.pending_captions[cache_key] = task
+        task.add_done_callback(lambda _: self.pending_captions.pop(cache_key, None))
+
+    async def caption_and_store(self, ctx: commands.Context, src: ImageSource, cache_key: str, digest: str | None, data: bytes, thumbnail_size: int) -> str | None:
+        start = time.perf_counter()
+        result = CompletionResult()
+        try:
+            data_thumbnail = await self.image_pool.run(constants.IMAGE_PROCESSING_TIMEOUT, utils.normalize_image, data, None, thumbnail_size)
+            image_content = utils.make_image_content(data_thumbnail or b'', low_detail=True)
+            caption = await self.execute_captioner(ctx, image_content, result)
+        except Exception:
+            log.exception(f"Captioning {src} in the background")
+            return None
+        if not caption:
+            log.warning(f"caption is None for {src}")
+            return None
+        if src.attachment:
+            self.attachment_caption_cache[src.attachment.id] = (src.att_index, caption)
+        elif src.url:
+            self.url_caption_cache[src.url] = caption
+        if digest:
+            await self.image_cache.put(cache_key, digest, caption=caption)
+        elapsed_ms = int(1000 * (time.perf_counter() - start))
+        self.deferred_captions += 1
+        self.deferred_caption_ms += elapsed_ms
+        log.info(f"Captioned {src} in the background {elapsed_ms=} cost={result.cost}")
+        return caption
 
     async def build_context(
         self,
@@ -62,20 +103,35 @@ class ChatHistoryContext:
         self.first_appearance: dict[int, int] = {}
         self.all_resolved_quotes: dict[int, discord.Message | None] = {}
         self.all_resolved_images: dict[int, DiscordMessageResolvedImages] = {}
+        self.linked_messages: dict[int, discord.Message | None] = {}
+        self.text_files: dict[int, str | None] = {}
+        self.caption_batch: list[tuple[AgentImageContent, asyncio.Future[str | None]]] = []
+        self.caption_batch_timer: asyncio.TimerHandle | None = None
 
 
     async def build(self) -> list[AgentMessage]:
         assert self.ctx.guild
+        channel_cache = self.builder.parsed_message_cache.setdefault(self.ctx.channel.id, {})
 
-        # Pass 1: grab quoted messages
+        # Pass 1: grab quoted messages, reusing the ones from unchanged messages
         quotes: dict[int, int | None] = {}
+        message_keys: dict[int, tuple] = {}
         for n, backmsg in enumerate(self.backread):
             ref = backmsg.reference
             if ref and not (len(self.backread) > n + 1 and ref.message_id == self.backread[n + 1].id):  # prevent consecutive quote chains
                 quotes[backmsg.id] = ref.message_id
             else:
                 quotes[backmsg.id] = None
-        quote_tasks = [self.resolve_quote(quote_id, backmsg) for backmsg in self.backread if (quote_id := quotes[backmsg.id])]
+            message_keys[backmsg.id] = (self.fingerprint(backmsg), quotes[backmsg.id])
+        quote_tasks = []
+        for backmsg in self.backread:
+            if not (quote_id := quotes[backmsg.id]):
+                continue
+            cached = channel_cache.get(backmsg.id)
+            if cached and cached.message_key == message_keys[backmsg.id]:
+                self.all_resolved_quotes[backmsg.id] = cached.quote
+            else:
+                quote_tasks.append(self.resolve_quote(quote_id, backmsg))
         quote_results_raw = await asyncio.gather(*quote_tasks, return_exceptions=True)
         for res in quote_results_raw:
             if isinstance(res, BaseException):
@@ -109,8 +165,39 @@ class ChatHistoryContext:
                         [s for s in caption_list if s.message_id == msg.id],
                     )
 
+        # Reuse parsed messages that would come out the same as in a previous context
+        reused_messages: dict[int, ParsedMessageResult] = {}
+        context_keys: dict[int, tuple] = {}
+        for backmsg in self.backread:
+            context_keys[backmsg.id] = self.context_key(backmsg)
+            cached = channel_cache.get(backmsg.id)
+            if cached and cached.message_key == message_keys[backmsg.id] and cached.context_key == context_keys[backmsg.id]:
+                reused_messages[backmsg.id] = cached.result
+
+        # Optional: estimate the token budget from text alone, so that images are only processed for messages that will be sent
+        survivors = self.backread
+        if self.config.lazy_images.value:
+            estimate_tasks = [self.parse_message_and_images(backmsg) for backmsg in self.backread if backmsg.id not in reused_messages]
+            estimate_results_raw = await asyncio.gather(*estimate_tasks, return_exceptions=True)
+            estimated_tokens: dict[int, int] = {msg_id: res.tokens for msg_id, res in reused_messages.items()}
+            for res in estimate_results_raw:
+                if isinstance(res, BaseException):
+                    log.warning(f"parse_message_and_images raised: {res}")
+                    continue
+                estimated_tokens[res.message_id] = res.tokens + constants.IMAGE_TOKENS * self.expected_images(res.message_id)
+            cutoff = self.token_cutoff([estimated_tokens.get(backmsg.id, 0) for backmsg in self.backread])
+            survivors = self.backread[:cutoff]
+            self.count_avoided_images(survivors)
+
+        required_images: set[int] = set()
+        for backmsg in survivors:
+            if backmsg.id not in reused_messages:
+                required_images.add(backmsg.id)
+                if quote := self.all_resolved_quotes.get(backmsg.id):
+                    required_images.add(quote.id)
+
         # Pass 3: grab images
-        image_tasks = [self.resolve_images(src.message) for src in self.all_candidates.values()]
+        image_tasks = [self.resolve_images(src.message) for src in self.all_candidates.values() if src.message.id in required_images]
         image_results_raw = await asyncio.gather(*image_tasks, return_exceptions=True)
         for res in image_results_raw:
             if isinstance(res, BaseException):
@@ -119,30 +206,121 @@ class ChatHistoryContext:
             self.all_resolved_images[res.message_id] = res
  
         # Pass 4: Parse each message and attach images
-        parse_tasks = [self.parse_message_and_images(backmsg) for backmsg in self.backread]
+        parse_tasks = [self.parse_message_and_images(backmsg) for backmsg in survivors if backmsg.id not in reused_messages]
         parse_results_raw = await asyncio.gather(*parse_tasks, return_exceptions=True)
-        all_parsed_messages: dict[int, ParsedMessageResult] = {}
+        all_parsed_messages: dict[int, ParsedMessageResult] = {msg.id: reused_messages[msg.id] for msg in survivors if msg.id in reused_messages}
+        self.result.messages_reused += len(all_parsed_messages)
+        self.result.messages_rebuilt += len(parse_tasks)
         for res in parse_results_raw:
             if isinstance(res, BaseException):
                 log.warning(f"parse_message_and_images raised: {res}")
                 continue
             all_parsed_messages[res.message_id] = res
+            quote = self.all_resolved_quotes.get(res.message_id)
+            if self.images_complete(res.message_id) and (not quote or self.images_complete(quote.id)):
+                channel_cache[res.message_id] = CachedParsedMessage(message_keys[res.message_id], context_keys[res.message_id], quote, res)
+        if len(channel_cache) > constants.PARSED_MESSAGE_CACHE_SIZE:
+            for msg_id in sorted(channel_cache)[:-constants.PARSED_MESSAGE_CACHE_SIZE]:
+                del channel_cache[msg_id]
 
         # Pass 5: trim to token budget and return
         parsed_messages = [parsed_message for backmsg in self.backread if (parsed_message := all_parsed_messages.get(backmsg.id))]
-        cumulative = 0
-        cutoff = len(parsed_messages)
-        for i, msg in enumerate(parsed_messages):
-            cumulative += msg.tokens
-            if i > 0 and cumulative > self.config.backread_tokens.value:
-                cutoff = i + 1  # it's fine to go over
-                break
+        cutoff = self.token_cutoff([msg.tokens for msg in parsed_messages])
         parsed_messages = parsed_messages[:cutoff]
         self.result.messages = len(parsed_messages)
         self.result.images = sum(msg.num_images for msg in parsed_messages)
         self.result.tokens.backread = sum(msg.tokens for msg in parsed_messages)
 
         return [msg.gpt_message for msg in reversed(parsed_messages)]
+
+
+    def token_cutoff(self, tokens: list[int]) -> int:
+        """How many messages, from newest to oldest, fit in the backread token budget."""
+        cumulative = 0
+        for i, message_tokens in enumerate(tokens):
+            cumulative += message_tokens
+            if i > 0 and cumulative > self.config.backread_tokens.value:
+                return i + 1  # it's fine to go over
+        return len(tokens)
+
+
+    def expected_images(self, msg_id: int) -> int:
+        """How many images will be sent in full alongside a message."""
+        quote = self.all_resolved_quotes.get(msg_id)
+        count = 0
+        for candidates in (self.all_candidates.get(msg_id), self.all_candidates.get(quote.id) if quote else None):
+            if candidates and self.first_appearance.get(candidates.message.id) == msg_id:
+                count += min(len(candidates.priority), constants.MAX_IMAGES_PER_MESSAGE)
+        return count
+
+
+    def count_avoided_images(self, survivors: list[discord.Message]):
+        """Counts the captions and downloads that would have been needed for messages outside the token budget."""
+        needed = set()
+        for backmsg in survivors:
+            needed.add(backmsg.id)
+            if quote := self.all_resolved_quotes.get(backmsg.id):
+                needed.add(quote.id)
+        for candidates in self.all_candidates.values():
+            if candidates.message.id in needed:
+                continue
+            priority_srcs = candidates.priority[:constants.MAX_IMAGES_PER_MESSAGE]
+            caption_srcs = candidates.caption[:constants.MAX_IMAGES_PER_MESSAGE - len(priority_srcs)]
+            for src in priority_srcs + caption_srcs:
+                if src.attachment:
+                    has_caption = src.attachment.id in self.builder.attachment_caption_cache
+                    has_image = src.attachment.id in self.builder.attachment_image_cache
+                else:
+                    has_caption = src.url in self.builder.url_caption_cache
+                    has_image = src.url in self.builder.url_image_cache
+                if not has_caption:
+                    self.result.captions_avoided += 1
+                if not has_caption or src in priority_srcs and not has_image:
+                    self.result.downloads_avoided += 1
+
+
+    @staticmethod
+    def fingerprint(msg: discord.Message) -> tuple:
+        """The parts of a message that can change without it being replaced."""
+        reactions = tuple((str(reaction.emoji), reaction.count, reaction.me) for reaction in msg.reactions[:5])
+        poll = tuple(answer.vote_count for answer in msg.poll.answers) if msg.poll else None
+        nickname = msg.author.nick if isinstance(msg.author, discord.Member) else None
+        return (msg.id, msg.edited_at, reactions, poll, len(msg.embeds), nickname)
+
+
+    def context_key(self, backmsg: discord.Message) -> tuple:
+        """The parts of the current context that affect how a message is parsed."""
+        quote = self.all_resolved_quotes.get(backmsg.id)
+        linked_id = None
+        if link := constants.DISCORD_MESSAGE_LINK_PATTERN.search(backmsg.content or ""):
+            linked_id = int(link.group("message_id"))
+        def candidates_key(msg: discord.Message | None) -> tuple | None:
+            if not msg or not (candidates := self.all_candidates.get(msg.id)):
+                return None
+            return (
+                self.first_appearance.get(msg.id) == backmsg.id,
+                tuple(src.attachment.id if src.attachment else src.url for src in candidates.priority),
+                tuple(src.attachment.id if src.attachment else src.url for src in candidates.caption),
+            )
+        return (
+            self.fingerprint(quote) if quote else None,
+            quote is not None and quote in self.backread,
+            linked_id is not None and any(msg.id == linked_id for msg in self.backread),
+            candidates_key(backmsg),
+            candidates_key(quote),
+            backmsg != self.backread[0] and self.builder.is_busy(backmsg.id),
+            self.config.max_quote.value,
+            self.config.max_text_file.value,
+            self.config.max_image_resolution.value,
+            self.config.max_caption_resolution.value,
+        )
+
+
+    def images_complete(self, msg_id: int) -> bool:
+        if msg_id not in self.all_candidates:
+            return True
+        images = self.all_resolved_images.get(msg_id)
+        return images is not None and images.complete
         
 
     async def resolve_quote(self, quote_id: int, backmsg: discord.Message) -> tuple[int, discord.Message | None]:
@@ -196,13 +374,19 @@ class ChatHistoryContext:
         image_contents: list[AgentImageContent] = []
         attachment_captions: dict[int, str] = {}
         url_captions: dict[str, str] = {}
+        complete = True
         for res in results_raw:
             if isinstance(res, BaseException):
                 log.warning(f"process_download raised: {res}")
+                complete = False
                 continue
             if res is None:
+                if not generated_image or not generated_image.get("Prompt"):
+                    complete = False
                 continue
             src, caption, data = res
+            if not caption and not generated_image:
+                complete = False  # captioned in the background, not ready to be reused
             if data:
                 image_contents.append(utils.make_image_content(data))
             if src.attachment:
@@ -210,7 +394,7 @@ class ChatHistoryContext:
             elif src.url:
                 url_captions[src.url] = caption
                 
-        return DiscordMessageResolvedImages(backmsg.id, image_contents, attachment_captions, url_captions, generated_image)
+        return DiscordMessageResolvedImages(backmsg.id, image_contents, attachment_captions, url_captions, generated_image, complete)
 
 
     async def process_image_full(self, src: ImageSource, generated_image: Any) -> tuple[ImageSource, str, bytes] | None:
@@ -226,23 +410,34 @@ class ChatHistoryContext:
             elif src.url:
                 data = self.builder.url_image_cache.get(src.url)
                 caption = self.builder.url_caption_cache.get(src.url, "")
+            cache_key = str(src.attachment.id) if src.attachment else key
+            digest = self.builder.image_cache.key_digest(cache_key)
+            changed = False
+            if not data:
+                data = await self.builder.image_cache.get_image(cache_key, self.config.max_image_resolution.value)
             if not data:
-                data = await self.fetch_and_normalize(src, max_resolution=self.config.max_image_resolution.value)
-                if not data:
+                fetched = await self.fetch_and_normalize(src, max_resolution=self.config.max_image_resolution.value)
+                if not fetched:
                     log.warning(f"image data is None for {src}")
                     return None
+                data, digest = fetched
+                changed = True
             if not caption and not generated_image:
-                data_thumbnail = await asyncio.to_thread(utils.normalize_image, data, None, self.config.max_caption_resolution.value)
-                image_content = utils.make_image_content(data_thumbnail or b'', low_detail=True)
-                caption = await self.builder.execute_captioner(self.ctx, image_content, self.result)
-                if not caption:
-                    log.warning(f"caption is None for {src}")
+                caption = self.builder.image_cache.get_caption(cache_key, digest) or ""
+            if not caption and not generated_image:
+                # the full image is already sent, so the caption is only needed by later contexts
+                self.builder.caption_in_background(self.ctx, src, cache_key, digest, data, self.config.max_caption_resolution.value)
+                self.result.captions_deferred += 1
             if src.attachment:
                 self.builder.attachment_image_cache[src.attachment.id] = (src.att_index, data)
-                self.builder.attachment_caption_cache[src.attachment.id] = (src.att_index, caption)
+                if caption:
+                    self.builder.attachment_caption_cache[src.attachment.id] = (src.att_index, caption)
             elif src.url:
                 self.builder.url_image_cache[src.url] = data
-                self.builder.url_caption_cache[src.url] = caption
+                if caption:
+                    self.builder.url_caption_cache[src.url] = caption
+            if changed and digest:
+                await self.builder.image_cache.put(cache_key, digest, data, caption, self.config.max_image_resolution.value)
             return src, caption, data
 
 
@@ -261,15 +456,25 @@ class ChatHistoryContext:
                 caption = self.builder.url_caption_cache.get(src.url)
             if caption:
                 return src, caption, None
-            data = await self.fetch_and_normalize(src, thumbnail_size=self.config.max_caption_resolution.value)
-            if data is None:
-                log.warning(f"image data is None for {src}")
-                return None
-            image_content = utils.make_image_content(data, low_detail=True)
-            caption = await self.builder.execute_captioner(self.ctx, image_content, self.result)
-            if caption is None:
-                log.warning(f"caption is None for {src}")
-                return None
+            cache_key = str(src.attachment.id) if src.attachment else key
+            if pending := self.builder.pending_captions.get(cache_key):
+                caption = await asyncio.shield(pending)
+            caption = caption or self.builder.image_cache.get_caption(cache_key)
+            data, digest = None, None
+            if not caption:
+                fetched = await self.fetch_and_normalize(src, thumbnail_size=self.config.max_caption_resolution.value)
+                if fetched is None:
+                    log.warning(f"image data is None for {src}")
+                    return None
+                data, digest = fetched
+                caption = self.builder.image_cache.get_caption(cache_key, digest)
+            if not caption and data and digest:
+                image_content = utils.make_image_content(data, low_detail=True)
+                caption = await self.caption(image_content)
+                if caption is None:
+                    log.warning(f"caption is None for {src}")
+                    return None
+                await self.builder.image_cache.put(cache_key, digest, caption=caption)
             if src.attachment:
                 self.builder.attachment_caption_cache[src.attachment.id] = (src.att_index, caption)
             elif src.url:
@@ -277,7 +482,51 @@ class ChatHistoryContext:
             return src, caption, None
 
 
-    async def fetch_and_normalize(self, src: ImageSource, max_resolution: int | None = None, thumbnail_size: int | None = None) -> bytes | None:
+    async def caption(self, image_content: AgentImageContent) -> str | None:
+        """Captions an image, batched together with other images of this context that need a caption around the same time."""
+        if self.config.caption_batch_size.value <= 1:
+            return await self.builder.execute_captioner(self.ctx, image_content, self.result)
+        future: asyncio.Future[str | None] = asyncio.get_running_loop().create_future()
+        self.caption_batch.append((image_content, future))
+        if len(self.caption_batch) >= self.config.caption_batch_size.value:
+            self.send_caption_batch()
+        elif self.caption_batch_timer is None:
+            self.caption_batch_timer = asyncio.get_running_loop().call_later(constants.CAPTION_BATCH_WINDOW, self.send_caption_batch)
+        return await future
+
+
+    def send_caption_batch(self):
+        if self.caption_batch_timer:
+            self.caption_batch_timer.cancel()
+            self.caption_batch_timer = None
+        batch, self.caption_batch = self.caption_batch, []
+        if batch:
+            asyncio.create_task(self.run_caption_batch(batch))
+
+
+    async def run_caption_batch(self, batch: list[tuple[AgentImageContent, asyncio.Future[str | None]]]):
+        captions: list[str | None] = [None] * len(batch)
+        if len(batch) > 1:
+            try:
+                captions = await self.builder.execute_batch_captioner(self.ctx, [image for image, _ in batch], self.result)
+            except Exception:
+                log.exception("Batch captioner, falling back to single captions")
+        missing = [i for i, caption in enumerate(captions) if not caption]
+        single_results = await asyncio.gather(*[self.builder.execute_captioner(self.ctx, batch[i][0], self.result) for i in missing], return_exceptions=True)
+        for i, single in zip(missing, single_results):
+            captions[i] = single if isinstance(single, str) else None
+            if isinstance(single, BaseException):
+                log.warning(f"Single captioner raised: {single}")
+        for (_, future), caption in zip(batch, captions):
+            if not future.done():
+                future.set_result(caption)
+
+
+    async def fetch_and_normalize(self, src: ImageSource, max_resolution: int | None = None, thumbnail_size: int | None = None) -> tuple[bytes, str] | None:
+        """
+        Downloads an image and normalizes it in the image pool. Returns the normalized image and the hash of the downloaded bytes,
+        which is the same for the full image and the caption thumbnail, as both download the same bytes.
+        """
         assert max_resolution or thumbnail_size
         max_pixels = max_resolution ** 2 if max_resolution else None
         try:
@@ -288,6 +537,8 @@ class ChatHistoryContext:
                     _, image_bytes = getattr(imagescanner, "image_cache").get(src.message_id, ({}, {}))
                     if src.att_index in image_bytes:
                         fp_before = BytesIO(image_bytes[src.att_index])
+                if fp_before.getbuffer().nbytes == 0:
+                    fp_before = await self.fetch_resized_attachment(src.attachment, self.config.max_image_resolution.value ** 2) or fp_before
                 if fp_before.getbuffer().nbytes == 0:
                     await src.attachment.save(fp_before, seek_begin=True)
             elif src.url:
@@ -295,15 +546,49 @@ class ChatHistoryContext:
                     response.raise_for_status()
                     fp_before = BytesIO(await response.read())
 
-            fp_after = await asyncio.to_thread(utils.normalize_image, fp_before, max_pixels, thumbnail_size)
+            source = fp_before.getvalue()
             del fp_before
-            return fp_after if fp_after else None
+            fp_after = await self.builder.image_pool.run(constants.IMAGE_PROCESSING_TIMEOUT, utils.normalize_image, source, max_pixels, thumbnail_size)
+            if not fp_after:
+                return None
+            return fp_after, await asyncio.to_thread(self.builder.image_cache.digest, source)
         except Exception as error:
             src_label = src.attachment.url if src.attachment else src.url
             log.warning(f"fetch_and_normalize {src_label}: {type(error).__name__}: {error}")
             return None
 
 
+    async def fetch_resized_attachment(self, attachment: discord.Attachment, max_pixels: int) -> BytesIO | None:
+        """
+        Downloads an image attachment already resized to the full image resolution by Discord's media proxy.
+        Captions use the same size and shrink it further, so that both get the same bytes and share a cache entry.
+        Returns None when the original is small enough or the proxy fails, in which case the original should be downloaded.
+        """
+        if not attachment.width or not attachment.height or attachment.content_type not in constants.PROXY_RESIZE_TYPES:
+            return None
+        scale = min(1.0, (max_pixels / (attachment.width * attachment.height)) ** 0.5)
+        if scale >= 1.0:
+            return None
+        params = {
+            "width": str(max(1, int(attachment.width * scale))),
+            "height": str(max(1, int(attachment.height * scale))),
+            "format": "webp",
+        }
+        try:
+            async with self.builder.session.get(attachment.proxy_url, params=params, headers=constants.MEDIA_HEADERS) as response:
+                response.raise_for_status()
+                if not response.content_type.startswith("image/"):
+                    return None
+                data = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            log.warning(f"fetch_resized_attachment {attachment.proxy_url}: {type(error).__name__}: {error}")
+            return None
+        if not data:
+            return None
+        self.result.image_bytes_saved += max(0, attachment.size - len(data))
+        return BytesIO(data)
+
+
     async def parse_message_and_images(self, backmsg: discord.Message) -> ParsedMessageResult:
         quote = self.all_resolved_quotes.get(backmsg.id)
         images = self.all_resolved_images.get(backmsg.id)
@@ -320,7 +605,7 @@ class ChatHistoryContext:
         if quoted_images and self.first_appearance[quoted_images.message_id] == backmsg.id:
             image_contents.extend(quoted_images.image_contents)
         text_tokens  = len(self.encoding.encode(text_content))
-        image_tokens = 1120 * len(image_contents)
+        image_tokens = constants.IMAGE_TOKENS * len(image_contents)
         total_tokens = text_tokens + image_tokens
         content: str | list[AgentImageContent]
 
@@ -404,9 +689,12 @@ class ChatHistoryContext:
                     }}
                 # Add quote for linked message if it is the first
                 if i == 0 and exhaustive and recursive and not generated_image:
-                    try:
-                        linked = await self.builder.bot.get_guild(guild_id).get_channel(channel_id).fetch_message(message_id) # type: ignore
-                    except (AttributeError, discord.NotFound):
+                    if message_id not in self.linked_messages:
+                        try:
+                            self.linked_messages[message_id] = await self.builder.bot.get_guild(guild_id).get_channel(channel_id).fetch_message(message_id) # type: ignore
+                        except (AttributeError, discord.NotFound):
+                            self.linked_messages[message_id] = None
+                    if not (linked := self.linked_messages[message_id]):
                         continue
                     linked_message_obj, linked_message_inlines = await self.parse_discord_message(
                         linked, None, exhaustive=linked not in self.backread, recursive=False
@@ -425,7 +713,9 @@ class ChatHistoryContext:
                 att_obj = {"@filename": attachment.filename}
                 if exhaustive and attachment.content_type and attachment.content_type.startswith("text") \
                         and total_file_length < self.config.max_text_file.value:
-                    if file_content := await self.read_text_file(attachment):
+                    if attachment.id not in self.text_files:
+                        self.text_files[attachment.id] = await self.read_text_file(attachment)
+                    if file_content := self.text_files[attachment.id]:
                         att_obj["content"] = file_content
                 if attachment_captions and i in attachment_captions:
                     att_obj["caption"] = attachment_captions[i]
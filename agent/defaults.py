@@ -19,6 +19,14 @@ TOOL_DEPTH = 3
 IMAGES_PER_CONTEXT = 1
 IMAGE_SIZE = 1024
 CAPTION_SIZE = 380
+CAPTION_BATCH_SIZE = 4
+RECALL_MODE = "llm"
+RECALL_TOP_K = 10
+RECALL_CACHE = True
+LAZY_IMAGES = False
+PRECAPTION_PER_HOUR = 30
+
+STREAM_RESPONSES = False
 
 ALLOW_MEMORIZER = False
 MEMORIZER_USER_ONLY = True
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from dataclasses import dataclass
+from collections import OrderedDict
+
+from agent.constants import IMAGE_CACHE_MAX_SIZE, IMAGE_CACHE_SAVE_DELAY, IMAGE_CACHE_URL_TTL
+
+log = logging.getLogger("agent.image_cache")
+
+ENTRY_OVERHEAD = 100  # bytes in the index for each entry
+KEY_OVERHEAD = 50  # bytes in memory and in the index for each attachment id or url, on top of its length
+
+
+@dataclass
+class ImageCacheEntry:
+    caption: str | None = None
+    image_size: int = 0  # size of the normalized image on disk, 0 if only the caption is stored
+    last_used: float = 0.0
+    image_resolution: int = 0  # max_image_resolution the image was normalized for
+
+    @property
+    def size(self) -> int:
+        return ENTRY_OVERHEAD + self.image_size + len((self.caption or "").encode())
+
+
+class ImageCache:
+    """
+    Captions and normalized images keyed by a hash of the downloaded image, so that reposts with a new attachment id or URL
+    are reused, and that they survive cog reloads. The hash is of the source bytes rather than of a normalized image,
+    which differs between the full image and the caption thumbnail. Stored in the cog's data path and bounded by total bytes,
+    evicting the least recently used entries. The index is loaded into memory on startup, image data is read on demand.
+    Attachment ids always point to the same content, but urls may not, so url keys are kept in memory and expire.
+    """
+    def __init__(self, path: Path, max_size: int = IMAGE_CACHE_MAX_SIZE):
+        self.path = path
+        self.index_path = path / "index.json"
+        self.max_size = max_size
+        self.entries: OrderedDict[str, ImageCacheEntry] = OrderedDict()
+        self.keys: dict[str, tuple[str, float]] = {}  # attachment id or url -> content hash and when it was seen
+        self.digest_keys: dict[str, set[str]] = {}  # content hash -> attachment ids and urls
+        self.size = 0
+        self.caption_hits = 0
+        self.caption_misses = 0
+        self.image_hits = 0
+        self.image_misses = 0
+        self.save_task: asyncio.Task | None = None
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    @property
+    def caption_hit_ratio(self) -> float:
+        total = self.caption_hits + self.caption_misses
+        return self.caption_hits / total if total else 0.0
+
+    @property
+    def image_hit_ratio(self) -> float:
+        total = self.image_hits + self.image_misses
+        return self.image_hits / total if total else 0.0
+
+    async def load(self):
+        start = time.perf_counter()
+        try:
+            entries, keys = await asyncio.to_thread(self._read_index)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            log.warning(f"Loading image cache: {type(error).__name__}: {error}")
+            return
+        for digest, entry in sorted(entries.items(), key=lambda item: item[1].last_used):
+            self.entries[digest] = entry
+            self.size += entry.size
+        for key, digest in keys.items():
+            if digest in self.entries:
+                self.map_key(key, digest, 0.0)
+        await self.evict()
+        elapsed_ms = int(1000 * (time.perf_counter() - start))
+        log.info(f"Loaded image cache with {len(self.entries)} entries and {self.size / 1_000_000:.1f} MB {elapsed_ms=}")
+
+    def _read_index(self) -> tuple[dict[str, ImageCacheEntry], dict[str, str]]:
+        if not self.index_path.exists():
+            return {}, {}
+        data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        entries = {}
+        for digest, (caption, image_size, last_used, *rest) in data["entries"].items():
+            if image_size and not (self.path / digest).exists():
+                image_size = 0
+            if caption or image_size:
+                entries[digest] = ImageCacheEntry(caption, image_size, last_used, rest[0] if rest else 0)
+        return entries, {key: digest for key, digest in data["keys"].items() if self.is_attachment_key(key)}
+
+    async def save(self):
+        for key in [key for key in self.keys if not self.is_attachment_key(key)]:
+            self.key_digest(key)  # forgets expired urls
+        entries = {digest: (entry.caption, entry.image_size, entry.last_used, entry.image_resolution) for digest, entry in self.entries.items()}
+        keys = {key: digest for key, (digest, _) in self.keys.items() if self.is_attachment_key(key)}
+        try:
+            await asyncio.to_thread(self._write_index, {"entries": entries, "keys": keys})
+        except OSError as error:
+            log.warning(f"Saving image cache: {type(error).__name__}: {error}")
+
+    def _write_index(self, data: dict):
+        self.path.mkdir(parents=True, exist_ok=True)
+        temp_path = self.index_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+        os.replace(temp_path, self.index_path)
+
+    def schedule_save(self):
+        if self.save_task is None or self.save_task.done():
+            self.save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(IMAGE_CACHE_SAVE_DELAY)
+        await self.save()
+
+    async def close(self):
+        if self.save_task and not self.save_task.done():
+            self.save_task.cancel()
+            await self.save()
+
+    @staticmethod
+    def is_attachment_key(key: str) -> bool:
+        return key.isdigit()
+
+    def key_digest(self, key: str) -> str | None:
+        """The content hash last seen for an attachment id, or for a url if it was seen recently enough."""
+        if (mapped := self.keys.get(key)) is None:
+            return None
+        digest, seen_at = mapped
+        if not self.is_attachment_key(key) and time.time() - seen_at > IMAGE_CACHE_URL_TTL:
+            self.unmap_key(key)
+            return None
+        return digest
+
+    def map_key(self, key: str, digest: str, seen_at: float | None = None):
+        self.unmap_key(key)
+        self.keys[key] = (digest, time.time() if seen_at is None else seen_at)
+        self.digest_keys.setdefault(digest, set()).add(key)
+        self.size += KEY_OVERHEAD + len(key)
+
+    def unmap_key(self, key: str):
+        if (mapped := self.keys.pop(key, None)) is None:
+            return
+        self.size -= KEY_OVERHEAD + len(key)
+        if (keys := self.digest_keys.get(mapped[0])) is not None:
+            keys.discard(key)
+            if not keys:
+                del self.digest_keys[mapped[0]]
+
+    def find(self, key: str, digest: str | None = None) -> tuple[str | None, ImageCacheEntry | None]:
+        digest = self.key_digest(key) or digest
+        entry = self.entries.get(digest) if digest else None
+        if entry:
+            entry.last_used = time.time()
+            self.entries.move_to_end(digest)  # type: ignore
+        return digest, entry
+
+    def get_caption(self, key: str, digest: str | None = None) -> str | None:
+        """Finds a caption by attachment id or url, or by content hash. Misses are only counted once the hash is known."""
+        digest, entry = self.find(key, digest)
+        if entry and entry.caption:
+            self.caption_hits += 1
+            if digest and self.key_digest(key) != digest:
+                self.map_key(key, digest)
+                self.schedule_save()
+            return entry.caption
+        if digest:
+            self.caption_misses += 1
+        return None
+
+    async def get_image(self, key: str, resolution: int) -> bytes | None:
+        """Finds a normalized image by attachment id or url, if it was normalized for the same max_image_resolution."""
+        digest, entry = self.find(key)
+        if entry and entry.image_size and entry.image_resolution == resolution:
+            try:
+                data = await asyncio.to_thread((self.path / digest).read_bytes)  # type: ignore
+                self.image_hits += 1
+                return data
+            except OSError:
+                self.size -= entry.image_size
+                entry.image_size = 0
+        self.image_misses += 1
+        return None
+
+    async def put(self, key: str, digest: str, data: bytes | None = None, caption: str | None = None, resolution: int = 0):
+        """Stores a caption and optionally the image normalized for a max_image_resolution, under the hash of the source image."""
+        entry = self.entries.get(digest) or ImageCacheEntry()
+        self.size -= entry.size if digest in self.entries else 0
+        if data and not (entry.image_size and entry.image_resolution == resolution):
+            try:
+                await asyncio.to_thread(self._write_image, digest, data)
+                entry.image_size = len(data)
+                entry.image_resolution = resolution
+            except OSError as error:
+                log.warning(f"Saving image to cache: {type(error).__name__}: {error}")
+        if caption:
+            entry.caption = caption
+        entry.last_used = time.time()
+        if entry.caption or entry.image_size:
+            self.entries[digest] = entry
+            self.entries.move_to_end(digest)
+            self.size += entry.size
+            self.map_key(key, digest)
+        await self.evict()
+        self.schedule_save()
+
+    def _write_image(self, digest: str, data: bytes):
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / digest).write_bytes(data)
+
+    async def evict(self):
+        evicted_images = []
+        while self.size > self.max_size and self.entries:
+            digest, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            for key in list(self.digest_keys.get(digest, ())):
+                self.unmap_key(key)
+            if entry.image_size:
+                evicted_images.append(digest)
+        if evicted_images:
+            await asyncio.to_thread(self._delete_images, evicted_images)
+
+    def _delete_images(self, digests: list[str]):
+        for digest in digests:
+            (self.path / digest).unlink(missing_ok=True)
@@ -0,0 +1,37 @@
+import discord
+
+
+class MemberIndex:
+    """
+    The usernames of each guild's members, so that checking whether a memory belongs to a user doesn't scan the member list.
+    A guild is indexed the first time it's needed, then kept up to date from member join, leave and user update events.
+    """
+    def __init__(self):
+        self.guilds: dict[int, dict[str, int]] = {}  # guild id -> username -> member id
+
+    def names(self, guild: discord.Guild) -> dict[str, int]:
+        """The usernames of a guild's members, mapped to their ids."""
+        names = self.guilds.get(guild.id)
+        if names is None:
+            names = self.guilds[guild.id] = {member.name: member.id for member in guild.members}
+        return names
+
+    def add(self, member: discord.Member):
+        if (names := self.guilds.get(member.guild.id)) is not None:
+            names[member.name] = member.id
+
+    def remove(self, guild_id: int, user: discord.abc.User):
+        if (names := self.guilds.get(guild_id)) is not None and names.get(user.name) == user.id:
+            del names[user.name]
+
+    def rename(self, before: discord.abc.User, after: discord.abc.User):
+        for names in self.guilds.values():
+            if names.get(before.name) == before.id:
+                del names[before.name]
+                names[after.name] = after.id
+
+    def clear(self, guild_id: int | None = None):
+        if guild_id is None:
+            self.guilds.clear()
+        else:
+            self.guilds.pop(guild_id, None)
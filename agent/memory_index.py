@@ -0,0 +1,79 @@
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class MemoryIndex:
+    """
+    A BM25 index over the names and contents of a guild's memories, used to recall them without an LLM,
+    or to narrow down the candidates that are shown to the recaller.
+    Built on the first search in a guild, then kept up to date by the memory store as memories are saved.
+    """
+    K1 = 1.2
+    B = 0.75
+    NAME_WEIGHT = 3  # name terms count as this many occurrences
+    NAME_MENTION_BONUS = 100.0  # memories whose name appears verbatim in the conversation come first
+
+    def __init__(self, memory: dict[str, str] | None = None):
+        self.contents: dict[str, str] = {}
+        self.lengths: dict[str, int] = {}
+        self.postings: dict[str, dict[str, int]] = defaultdict(dict)  # term -> {memory name: frequency}
+        self.mention_patterns: dict[str, re.Pattern] = {}  # memory name -> the name as a whole word
+        self.total_length = 0
+        for name, content in (memory or {}).items():
+            self.add(name, content)
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        return [word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 1]
+
+    @staticmethod
+    def mention_pattern(name: str) -> re.Pattern:
+        """Matches the name only when it isn't part of a longer word, so short names don't match inside most queries."""
+        return re.compile(rf"(?<!\w){re.escape(name.lower())}(?!\w)")
+
+    def add(self, name: str, content: str):
+        self.remove(name)
+        terms = Counter(self.tokenize(name) * self.NAME_WEIGHT + self.tokenize(content))
+        for term, frequency in terms.items():
+            self.postings[term][name] = frequency
+        self.contents[name] = content
+        self.mention_patterns[name] = self.mention_pattern(name)
+        self.lengths[name] = sum(terms.values())
+        self.total_length += self.lengths[name]
+
+    def remove(self, name: str):
+        if name not in self.contents:
+            return
+        content = self.contents.pop(name)
+        self.mention_patterns.pop(name, None)
+        for term in set(self.tokenize(name) + self.tokenize(content)):
+            if (postings := self.postings.get(term)) is not None:
+                postings.pop(name, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(name)
+
+    def search(self, query: str, limit: int) -> list[str]:
+        """Returns up to limit memory names relevant to the query, from most to least relevant."""
+        if not self.contents:
+            return []
+        total = len(self.contents)
+        average_length = self.total_length / total or 1
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(self.tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for name, frequency in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[name] / average_length)
+                scores[name] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+        lowered = query.lower()
+        for name, pattern in self.mention_patterns.items():
+            if pattern.search(lowered):
+                scores[name] += self.NAME_MENTION_BONUS
+        return heapq.nlargest(limit, scores, key=scores.__getitem__)
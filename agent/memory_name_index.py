@@ -0,0 +1,52 @@
+import heapq
+from collections import Counter
+from rapidfuzz import process, fuzz
+
+CANDIDATES = 32  # names sharing the most trigrams with the query, rescored by similarity
+DEFAULT_CUTOFF = 60  # same as difflib's default of 0.6
+
+
+class MemoryNameIndex:
+    """
+    A trigram index over the memory names of a guild, for finding the name closest to a misspelled one
+    without comparing it against every memory. Kept up to date by the memory store as memories are saved.
+    """
+    def __init__(self, names: list[str] | None = None):
+        self.names: set[str] = set()
+        self.postings: dict[str, set[str]] = {}  # trigram -> names containing it
+        for name in names or []:
+            self.add(name)
+
+    @staticmethod
+    def trigrams(name: str) -> set[str]:
+        padded = f"  {name.lower()} "
+        return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+    def add(self, name: str):
+        if name in self.names:
+            return
+        self.names.add(name)
+        for trigram in self.trigrams(name):
+            self.postings.setdefault(trigram, set()).add(name)
+
+    def remove(self, name: str):
+        if name not in self.names:
+            return
+        self.names.discard(name)
+        for trigram in self.trigrams(name):
+            if (names := self.postings.get(trigram)) is not None:
+                names.discard(name)
+                if not names:
+                    del self.postings[trigram]
+
+    def closest(self, query: str, limit: int = 1, cutoff: float = DEFAULT_CUTOFF) -> list[str]:
+        """Up to limit names similar to the query, from most to least similar."""
+        if query in self.names:
+            return [query]
+        counts: Counter[str] = Counter()
+        for trigram in self.trigrams(query):
+            counts.update(self.postings.get(trigram, ()))
+        if not counts:
+            return []
+        candidates = heapq.nlargest(CANDIDATES, counts, key=counts.__getitem__)
+        return [name for name, _, _ in process.extract(query, candidates, scorer=fuzz.ratio, score_cutoff=cutoff, limit=limit)]
@@ -0,0 +1,163 @@
+import time
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.schema import MemoryChangeResult
+from agent.memory_index import MemoryIndex
+from agent.memory_name_index import MemoryNameIndex
+
+log = logging.getLogger("agent.memory_store")
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    guild_id   INTEGER NOT NULL,
+    name       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS memory_history (
+    id         INTEGER PRIMARY KEY,
+    guild_id   INTEGER NOT NULL,
+    name       TEXT NOT NULL,
+    before     TEXT,
+    after      TEXT,
+    source     TEXT NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_history_name ON memory_history (guild_id, name, changed_at);
+"""
+
+
+class MemoryStore:
+    """
+    Guild memories in a SQLite database in the cog's data path, so that each change only writes the memories it touches
+    instead of the whole dict going through Red's config. Every change is also recorded in a history table.
+    All memories are kept in memory for reading, and callers edit those dicts directly before saving their changes.
+    The connection lives in a single thread, which also keeps writes in order.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.memories: dict[int, dict[str, str]] = {}
+        self.name_guilds: dict[str, set[int]] = {}  # memory name -> ids of the guilds that have it
+        self.name_indexes: dict[int, MemoryNameIndex] = {}
+        self.content_indexes: dict[int, MemoryIndex] = {}  # only for guilds that searched their memories
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent_memory_store")
+        self.connection: sqlite3.Connection | None = None
+        self.writes = 0
+        self.write_ms = 0.0
+
+    def get(self, guild_id: int) -> dict[str, str]:
+        """The memories of a guild, by name."""
+        return self.memories.setdefault(guild_id, {})
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def open(self):
+        start = time.perf_counter()
+        rows = await self.run(self._open)
+        for guild_id, name, content in rows:
+            self.get(guild_id)[name] = content
+            self.name_guilds.setdefault(name, set()).add(guild_id)
+        self.name_indexes = {guild_id: MemoryNameIndex(list(memory)) for guild_id, memory in self.memories.items()}
+        elapsed_ms = int(1000 * (time.perf_counter() - start))
+        log.info(f"Loaded {len(rows)} memories from {len(self.memories)} guilds {elapsed_ms=}")
+
+    def _open(self) -> list[tuple[int, str, str]]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")  # durable on commit in WAL mode, except on power loss
+        self.connection.executescript(SCHEMA)
+        return self.connection.execute("SELECT guild_id, name, content FROM memories ORDER BY rowid").fetchall()
+
+    async def close(self):
+        if self.connection:
+            await self.run(self.connection.close)
+            self.connection = None
+        self.executor.shutdown(wait=False)
+
+    def closest(self, guild_id: int, name: str) -> str | None:
+        """The name of the guild's memory most similar to this name, if any is similar enough."""
+        matches = self.name_indexes.get(guild_id, MemoryNameIndex()).closest(name)
+        return matches[0] if matches else None
+
+    def search(self, guild_id: int, query: str, limit: int) -> list[str]:
+        """Names of the guild's memories most relevant to the query, from the BM25 index of their contents."""
+        index = self.content_indexes.get(guild_id)
+        if index is None:
+            index = self.content_indexes[guild_id] = MemoryIndex(self.get(guild_id))
+        return index.search(query, limit)
+
+    def guilds_with(self, name: str) -> list[int]:
+        """The ids of the guilds that have a memory with this name."""
+        return list(self.name_guilds.get(name, ()))
+
+    async def migrate(self, guild_id: int, memory: dict[str, str]):
+        """Imports memories from the old config. Memories already in the store are kept."""
+        changes = [MemoryChangeResult(name, None, content) for name, content in memory.items() if name not in self.get(guild_id)]
+        for change in changes:
+            self.get(guild_id)[change.name] = change.after  # type: ignore
+        await self.save(guild_id, changes, "migration")
+        log.info(f"Migrated {len(changes)} memories from guild {guild_id}")
+
+    async def save(self, guild_id: int, changes: list[MemoryChangeResult], source: str):
+        """Writes changes that were already made to the memories in memory."""
+        if not changes:
+            return
+        name_index = self.name_indexes.setdefault(guild_id, MemoryNameIndex())
+        content_index = self.content_indexes.get(guild_id)
+        for change in changes:
+            if content_index is not None:
+                if change.after is None:
+                    content_index.remove(change.name)
+                else:
+                    content_index.add(change.name, change.after)
+            if change.after is None:
+                name_index.remove(change.name)
+                if (guilds := self.name_guilds.get(change.name)) is not None:
+                    guilds.discard(guild_id)
+                    if not guilds:
+                        del self.name_guilds[change.name]
+            else:
+                name_index.add(change.name)
+                self.name_guilds.setdefault(change.name, set()).add(guild_id)
+        start = time.perf_counter()
+        await self.run(self._save, guild_id, changes, source, time.time())
+        self.writes += 1
+        self.write_ms += 1000 * (time.perf_counter() - start)
+
+    def _save(self, guild_id: int, changes: list[MemoryChangeResult], source: str, now: float):
+        assert self.connection
+        with self.connection:
+            for change in changes:
+                if change.after is None:
+                    self.connection.execute("DELETE FROM memories WHERE guild_id = ? AND name = ?", (guild_id, change.name))
+                else:
+                    self.connection.execute(
+                        "INSERT INTO memories (guild_id, name, content, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (guild_id, name) DO UPDATE SET content = excluded.content, updated_at = excluded.updated_at",
+                        (guild_id, change.name, change.after, now)
+                    )
+            self.connection.executemany(
+                "INSERT INTO memory_history (guild_id, name, before, after, source, changed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(guild_id, change.name, change.before, change.after, source, now) for change in changes]
+            )
+
+    async def history(self, guild_id: int, name: str, limit: int) -> list[tuple[str | None, str | None, str, float]]:
+        """The latest changes to a memory, newest first, as (before, after, source, timestamp)."""
+        return await self.run(self._history, guild_id, name, limit)
+
+    def _history(self, guild_id: int, name: str, limit: int) -> list[tuple[str | None, str | None, str, float]]:
+        assert self.connection
+        return self.connection.execute(
+            "SELECT before, after, source, changed_at FROM memory_history WHERE guild_id = ? AND name = ? ORDER BY changed_at DESC, id DESC LIMIT ?",
+            (guild_id, name, limit)
+        ).fetchall()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import discord
+from collections import deque
+from datetime import datetime
+from expiringdict import ExpiringDict
+from redbot.core.bot import Red
+
+from agent.constants import MESSAGE_CACHE_SIZE, MESSAGE_CACHE_FILL, MESSAGE_CACHE_CHANNELS, MESSAGE_CACHE_MAX_AGE
+
+log = logging.getLogger("agent.message_cache")
+
+
+class ChannelMessageBuffer:
+    """
+    The most recent messages of a single channel, ordered from oldest to newest.
+    """
+    def __init__(self, max_len: int):
+        self.messages: deque[discord.Message] = deque(maxlen=max_len)
+        self.filled = False  # whether the history has been fetched at least once
+        self.complete = False  # whether the buffer holds every message ever sent in the channel
+
+    def __contains__(self, message_id: int) -> bool:
+        return any(msg.id == message_id for msg in self.messages)
+
+    def add(self, message: discord.Message):
+        if message.id in self:
+            return self.replace(message)
+        if len(self.messages) == self.messages.maxlen:
+            self.complete = False
+        if not self.messages or message.id > self.messages[-1].id:
+            self.messages.append(message)
+            return
+        # rare: events arriving out of order
+        ordered = sorted([*self.messages, message], key=lambda msg: msg.id)
+        self.messages.clear()
+        self.messages.extend(ordered)
+
+    def replace(self, message: discord.Message):
+        for i, msg in enumerate(self.messages):
+            if msg.id == message.id:
+                self.messages[i] = message
+                return
+
+    def remove(self, message_ids: set[int]):
+        if any(msg.id in message_ids for msg in self.messages):
+            kept = [msg for msg in self.messages if msg.id not in message_ids]
+            self.messages.clear()
+            self.messages.extend(kept)
+
+
+class MessageCache:
+    """
+    Keeps the recent history of active channels in memory, kept up to date through gateway events,
+    so that backreads don't have to paginate the channel history through the REST API on every response.
+    A channel is only tracked after its history is requested for the first time.
+    """
+    def __init__(self, bot: Red):
+        self.bot = bot
+        self.buffers: dict[int, ChannelMessageBuffer] = ExpiringDict(max_len=MESSAGE_CACHE_CHANNELS, max_age_seconds=MESSAGE_CACHE_MAX_AGE)
+        self.fill_locks: dict[int, asyncio.Lock] = ExpiringDict(max_len=MESSAGE_CACHE_CHANNELS, max_age_seconds=120)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        """Forgets all channels, for example when gateway events may have been missed."""
+        self.buffers.clear()
+
+    def add(self, message: discord.Message):
+        if buffer := self.buffers.get(message.channel.id):
+            buffer.add(message)
+
+    def remove(self, channel_id: int, message_ids: set[int]):
+        if buffer := self.buffers.get(channel_id):
+            buffer.remove(message_ids)
+
+    async def update(self, payload: discord.RawMessageUpdateEvent):
+        buffer = self.buffers.get(payload.channel_id)
+        if not buffer or payload.message_id not in buffer:
+            return
+        # the message in the bot's own cache is edited in place right after the raw event is dispatched
+        message = getattr(payload, "message", None) or discord.utils.get(self.bot.cached_messages, id=payload.message_id)
+        if not message:
+            channel = self.bot.get_channel(payload.channel_id)
+            if not isinstance(channel, (discord.TextChannel, discord.Thread)):
+                return
+            try:
+                message = await channel.fetch_message(payload.message_id)
+            except discord.NotFound:
+                return buffer.remove({payload.message_id})
+            except discord.DiscordException as error:
+                log.warning(f"Refreshing edited message {payload.message_id}: {type(error).__name__}: {error}")
+                return buffer.remove({payload.message_id})
+        buffer.replace(message)
+
+    async def history(
+        self,
+        channel: discord.TextChannel | discord.Thread,
+        limit: int,
+        before: discord.Message,
+        after: datetime,
+    ) -> list[discord.Message]:
+        """
+        Equivalent to channel.history with oldest_first=False,
+        served from memory whenever the buffer covers the requested range.
+        """
+        buffer = self.buffers.get(channel.id)
+        cold = buffer is None or not buffer.filled
+        if cold:
+            buffer = await self.fill(channel, limit)
+        else:
+            self.buffers[channel.id] = buffer  # expiry counts from the last use, so active channels aren't refilled
+        after_id = discord.utils.time_snowflake(after)
+        available = [msg for msg in reversed(buffer.messages) if after_id < msg.id < before.id]
+        covered = buffer.complete or len(available) >= limit or bool(buffer.messages) and buffer.messages[0].id <= after_id
+        if buffer.filled and covered:
+            if cold:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return available[:limit]
+        self.misses += 1
+        return [message async for message in channel.history(limit=limit, before=before, after=after, oldest_first=False)]
+
+    async def fill(self, channel: discord.TextChannel | discord.Thread, limit: int = 0) -> ChannelMessageBuffer:
+        """Fetches enough history for the requested limit on top of the triggering message, within the buffer size."""
+        fill_size = min(MESSAGE_CACHE_SIZE, max(MESSAGE_CACHE_FILL, limit + 1))
+        lock = self.fill_locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            buffer = self.buffers.get(channel.id)
+            if buffer is not None and buffer.filled:
+                return buffer
+            # messages that arrive while fetching are added to the buffer by the event listeners
+            buffer = ChannelMessageBuffer(MESSAGE_CACHE_SIZE)
+            self.buffers[channel.id] = buffer
+            try:
+                fetched = [message async for message in channel.history(limit=fill_size)]
+            except discord.DiscordException as error:
+                log.warning(f"Filling message cache for {channel.id}: {type(error).__name__}: {error}")
+                self.buffers.pop(channel.id, None)
+                return buffer
+            # prefer the bot's own cached objects, which receive reaction updates
+            cached = {msg.id: msg for msg in self.bot.cached_messages if msg.channel.id == channel.id}
+            merged = {msg.id: cached.get(msg.id, msg) for msg in fetched}
+            merged.update({msg.id: msg for msg in buffer.messages})
+            buffer.messages.clear()
+            buffer.messages.extend(sorted(merged.values(), key=lambda msg: msg.id)[-MESSAGE_CACHE_SIZE:])
+            buffer.complete = len(fetched) < fill_size
+            buffer.filled = True
+            return buffer
@@ -0,0 +1,124 @@
+import time
+import asyncio
+import logging
+import discord
+from typing import TYPE_CHECKING
+from collections import deque, defaultdict
+
+from agent.schema import CompletionResult, ImageSource
+from agent.context_builder import ChatHistoryContext
+from agent.constants import PRECAPTION_QUEUE_SIZE, PRECAPTION_BUSY_LIMIT, PRECAPTION_TIMEOUT, MAX_IMAGES_PER_MESSAGE
+
+if TYPE_CHECKING:
+    from agent.agent import AgentCog
+
+log = logging.getLogger("agent.precaptioner")
+
+
+class Precaptioner:
+    """
+    Captions image attachments at low priority as they're posted in enabled channels,
+    so that later responses find them in the caption cache instead of waiting for the captioner.
+    Work is dropped rather than delayed when the bot is busy responding.
+    """
+    def __init__(self, cog: "AgentCog"):
+        self.cog = cog
+        self.stopping = False
+        self.queue: asyncio.Queue[discord.Message] = asyncio.Queue(maxsize=PRECAPTION_QUEUE_SIZE)
+        self.workers: list[asyncio.Task] = []
+        self.running: set[asyncio.Task] = set()
+        self.budgets: dict[int, deque[float]] = defaultdict(deque)  # guild id -> recent caption times
+        self.captioned = 0
+        self.dropped = 0
+
+    async def start(self, concurrency: int):
+        await self.stop()
+        self.stopping = False
+        self.workers = [asyncio.create_task(self.work()) for _ in range(max(1, concurrency))]
+
+    async def stop(self):
+        """Cancels the workers and waits for them to exit, so that a restart doesn't leave old ones running."""
+        self.stopping = True
+        tasks = self.workers + list(self.running)
+        for task in tasks:
+            task.cancel()
+        self.workers = []
+        self.cancel_pending()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel_pending(self):
+        """Drops queued and in-progress captions."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.dropped += 1
+        for task in list(self.running):
+            task.cancel()
+
+    @property
+    def overloaded(self) -> bool:
+        return len(self.cog.currently_responding) > PRECAPTION_BUSY_LIMIT
+
+    def submit(self, message: discord.Message):
+        if not message.guild or message.author.bot or not message.attachments:
+            return
+        if not any(att.content_type and att.content_type.startswith("image/") for att in message.attachments):
+            return
+        config = self.cog.config[message.guild]
+        channel_ids = config.precaption_channels.value
+        if config.precaption_channel_mode.value == "whitelist" and message.channel.id not in channel_ids:
+            return
+        if config.precaption_channel_mode.value == "blacklist" and message.channel.id in channel_ids:
+            return
+        if self.overloaded:
+            self.dropped += 1
+            return self.cancel_pending()
+        if not self.take_budget(message.guild.id, config.precaption_per_hour.value):
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def take_budget(self, guild_id: int, per_hour: int) -> bool:
+        budget = self.budgets[guild_id]
+        now = time.time()
+        while budget and now - budget[0] > 3600:
+            budget.popleft()
+        if len(budget) >= per_hour:
+            return False
+        budget.append(now)
+        return True
+
+    async def work(self):
+        while True:
+            message = await self.queue.get()
+            if self.overloaded:
+                self.dropped += 1
+                continue
+            task = asyncio.create_task(self.precaption(message))
+            self.running.add(task)
+            try:
+                await asyncio.wait_for(task, PRECAPTION_TIMEOUT)
+            except asyncio.CancelledError:
+                if self.stopping:
+                    raise
+                self.dropped += 1
+            except asyncio.TimeoutError:
+                self.dropped += 1
+            except Exception:
+                log.exception(f"Precaptioning message {message.id}")
+            finally:
+                self.running.discard(task)
+
+    async def precaption(self, message: discord.Message):
+        assert message.guild
+        ctx = await self.cog.bot.get_context(message)
+        config = self.cog.config[message.guild]
+        history = ChatHistoryContext(self.cog.context_builder, ctx, [message], config, CompletionResult(), self.cog.encoding)
+        sources = [
+            ImageSource(message.id, attachment=att, att_index=i)
+            for i, att in enumerate(message.attachments)
+            if att.content_type and att.content_type.startswith("image/")
+        ][:MAX_IMAGES_PER_MESSAGE]
+        results = await asyncio.gather(*[history.process_image_caption(src, None) for src in sources])
+        self.captioned += sum(1 for res in results if res)
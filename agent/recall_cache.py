@@ -0,0 +1,68 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Coroutine
+from expiringdict import ExpiringDict
+
+from agent.constants import RECALL_CACHE_CHANNELS, RECALL_CACHE_MAX_AGE, RECALL_CACHE_MAX_NEW_MESSAGES
+
+log = logging.getLogger("agent.recall_cache")
+
+
+@dataclass
+class RecallCacheEntry:
+    participants: frozenset[int]
+    message_ids: frozenset[int]  # the backread used to recall these memories
+    memory_names: set[str]
+    created_at: float
+
+
+class RecallCache:
+    """
+    The memories recalled for the latest response in each channel, reused by the next response
+    as long as the participants are the same and only a few new messages were sent since.
+    Reused entries are refreshed in the background for the turn after.
+    """
+    def __init__(self):
+        self.entries: dict[int, RecallCacheEntry] = ExpiringDict(max_len=RECALL_CACHE_CHANNELS, max_age_seconds=RECALL_CACHE_MAX_AGE)
+        self.refreshing: dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, channel_id: int, participants: frozenset[int], message_ids: list[int]) -> set[str] | None:
+        entry = self.entries.get(channel_id)
+        new_messages = sum(1 for message_id in message_ids if message_id not in entry.message_ids) if entry else 0
+        if not entry or entry.participants != participants or new_messages > RECALL_CACHE_MAX_NEW_MESSAGES:
+            self.misses += 1
+            log.info(f"Recall cache miss in {channel_id} ({self.hit_ratio:.1%} hit ratio)")
+            return None
+        self.hits += 1
+        age = int(time.time() - entry.created_at)
+        log.info(f"Recall cache hit in {channel_id} {new_messages=} {age=} ({self.hit_ratio:.1%} hit ratio)")
+        return entry.memory_names
+
+    def put(self, channel_id: int, participants: frozenset[int], message_ids: list[int], memory_names: set[str]):
+        self.entries[channel_id] = RecallCacheEntry(participants, frozenset(message_ids), memory_names, time.time())
+
+    def refresh(self, channel_id: int, coro: Coroutine):
+        """Runs a recall in the background unless one is already running for this channel."""
+        if (task := self.refreshing.get(channel_id)) and not task.done():
+            coro.close()
+            return
+        task = asyncio.create_task(coro)
+        self.refreshing[channel_id] = task
+        task.add_done_callback(lambda _: self.refreshing.pop(channel_id, None))
+
+    def clear(self, channel_id: int | None = None):
+        if channel_id is None:
+            for task in self.refreshing.values():
+                task.cancel()
+            self.entries.clear()
+        else:
+            self.entries.pop(channel_id, None)
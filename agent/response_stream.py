@@ -0,0 +1,95 @@
+import time
+import logging
+import discord
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.lib.streaming.chat import ChatCompletionStreamState
+from redbot.core import commands
+
+from agent import utils as utils
+from agent import constants as constants
+
+log = logging.getLogger("agent.stream")
+
+
+class ResponseStream:
+    """
+    Shows a responder completion in chat while it's being generated,
+    by sending its first sentences as soon as they arrive and then editing or appending messages periodically.
+    """
+    def __init__(self, ctx: commands.Context, do_reply: bool):
+        self.ctx = ctx
+        self.do_reply = do_reply
+        self.messages: list[discord.Message] = []
+        self.raw_text = ""
+        self.shown_text = ""
+        self.last_update = 0.0
+        self.first_sent_at: float | None = None
+
+    async def consume(self, stream: AsyncStream[ChatCompletionChunk]) -> ChatCompletion | None:
+        """Reads a completion stream while updating the preview, and returns the accumulated completion."""
+        state = ChatCompletionStreamState()
+        received = False
+        self.raw_text = ""
+        async for chunk in stream:
+            received = True
+            state.handle_chunk(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                self.raw_text += chunk.choices[0].delta.content
+                if time.perf_counter() - self.last_update >= constants.STREAM_EDIT_INTERVAL:
+                    await self.update(self.preview(self.raw_text))
+        if not received:
+            return None
+        return state.get_final_completion()
+
+    def preview(self, raw_text: str) -> str:
+        """The part of an unfinished completion that is safe to show, up to its last sentence boundary."""
+        text = raw_text
+        for _, pattern, repl in constants.RESPONSE_CLEANUP_PATTERNS:
+            text = pattern.sub(repl, text)
+        text = constants.OPENING_XML_PATTERN.sub("", text)
+        text = text.split("<", 1)[0]  # unfinished tags or objects that will be cleaned up later
+        boundaries = list(constants.SENTENCE_BOUNDARY_PATTERN.finditer(text))
+        if not boundaries:
+            return ""
+        return utils.clean_response(self.ctx.bot, text[:boundaries[-1].end()])
+
+    async def update(self, text: str, view: discord.ui.View | None = None, files: list[discord.File] | None = None, final: bool = False):
+        if not final and (not text or text == self.shown_text):
+            return
+        self.last_update = time.perf_counter()
+        self.shown_text = text
+        chunks = utils.chunk_text(text)
+        if final and not chunks and (view or files):
+            chunks = [""]  # the first preview message is kept to carry them
+        try:
+            for i, chunk in enumerate(chunks):
+                is_last = i == len(chunks) - 1
+                current_view = view if final and is_last else None
+                current_files = (files or []) if final and is_last else []
+                if i < len(self.messages):
+                    if self.messages[i].content != chunk or current_view or current_files:
+                        self.messages[i] = await self.messages[i].edit(content=chunk, view=current_view, attachments=current_files)
+                else:
+                    self.messages.append(await self.ctx.send(
+                        chunk,
+                        view=current_view,
+                        files=current_files,
+                        reference=self.ctx.message if self.do_reply and i == 0 else None,
+                        allowed_mentions=discord.AllowedMentions.none(),
+                        mention_author=False,
+                    ))
+                    if self.first_sent_at is None:
+                        self.first_sent_at = time.perf_counter()
+                if current_view and hasattr(current_view, "message"):
+                    setattr(current_view, "message", self.messages[i])
+            if final:
+                for message in self.messages[len(chunks):]:
+                    await message.delete()
+                del self.messages[len(chunks):]
+        except discord.DiscordException as error:
+            log.warning(f"Updating streamed response: {type(error).__name__}: {error}")
+
+    async def finish(self, text: str, view: discord.ui.View | None = None, files: list[discord.File] | None = None):
+        """Replaces the preview with the final cleaned up completion."""
+        await self.update(text, view, files, final=True)
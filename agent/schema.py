@@ -1,3 +1,4 @@
+import time
 import discord
 from enum import Enum
 from typing import Any, Literal
@@ -40,6 +41,15 @@ class DiscordMessageResolvedImages:
     attachment_captions: dict[int, str]
     url_captions: dict[str, str]
     generated_image: dict[str, str] | None
+    complete: bool = True  # whether every image was resolved, otherwise it should be retried later
+
+
+@dataclass(frozen=True)
+class CachedParsedMessage:
+    message_key: tuple  # the message itself and its quote reference
+    context_key: tuple  # everything else in the context that affected the result
+    quote: discord.Message | None
+    result: ParsedMessageResult
 
 
 @dataclass
@@ -59,13 +69,23 @@ class TokensDetailsResult:
 @dataclass
 class CompletionResult:
     elapsed_ms: float = 0
+    first_text_ms: float = 0
     input_tokens: int = 0
     output_tokens: int = 0
     cost: float | str = "unknown"
     messages: int = 0
     images: int = 0
     tool_calls: int = 0
+    tools_ms: dict[str, int] = field(default_factory=dict)
+    messages_reused: int = 0
+    messages_rebuilt: int = 0
+    captions_avoided: int = 0
+    captions_deferred: int = 0
+    downloads_avoided: int = 0
+    image_bytes_saved: int = 0
+    image_payload_bytes: int = 0
     tokens: TokensDetailsResult = field(default_factory=TokensDetailsResult)
+    start: float = field(default_factory=time.perf_counter, repr=False)
 
     def add_cost(self, cost: float):
         if isinstance(self.cost, str):
@@ -99,6 +119,13 @@ class MemoryChange(BaseModel):
 class MemoryChangeList(BaseModel):
     memory_changes: list[MemoryChange]
 
+class ImageCaption(BaseModel):
+    image_number: int
+    caption: str
+
+class ImageCaptionList(BaseModel):
+    captions: list[ImageCaption]
+
 class MessageReaction(BaseModel):
     reason: str
     emote: str
@@ -13,6 +13,7 @@ log = logging.getLogger("agent.arcenciel_image")
 
 class ArcencielImageTool(ToolBase):
     display_name="arcenciel_image"
+    timeout = 300
     settings = {"enable_regional_prompt": ""}
     schema = ToolCall(
         Function(
@@ -44,8 +45,9 @@ class ArcencielImageTool(ToolBase):
 
     async def find_attachment(self, filename: str) -> tuple[bool, (discord.Message | None)]:
         assert self.ctx.guild
-        limit = self.cog.config[self.ctx.guild].backread_messages.value
-        messages = [message async for message in self.ctx.channel.history(limit=limit)]
+        # the latest backread_messages messages including the trigger, regardless of [p]forget
+        limit = self.cog.config[self.ctx.guild].backread_messages.value - 1
+        messages = await self.cog.fetch_message_history(self.ctx, limit=limit, ignore_start=True)
         if self.ctx.message and self.ctx.message.reference and self.ctx.message.reference.message_id:
             quoted = self.ctx.message.reference.cached_message or await self.ctx.channel.fetch_message(self.ctx.message.reference.message_id)
             messages.insert(0, quoted)
@@ -1,21 +1,26 @@
 import json
+import time
+import hashlib
 import logging
 import itertools
 import asyncio
-import aiofiles
 from typing import Any
+from pathlib import Path
 from rapidfuzz import process, fuzz
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 
 from agent.utils import clean_tag
 from agent.schema import ToolCall, Function, Parameters
+from agent.base import AgentCogBase
 from agent.tools.base import ToolBase
+from agent.constants import BOORU_TAGS_FUZZY_LIMIT
 
 log = logging.getLogger("agent.boorutags")
 
 
 class BooruTagsTool(ToolBase):
     display_name = "booru_tags"
+    timeout = 15
     settings = {"boorutag_emoji": "🗒️"}
     schema = ToolCall(
         Function(
@@ -30,33 +35,121 @@ class BooruTagsTool(ToolBase):
                 required=["query"],
             )))
 
-    tag_groups: dict = {}
-    all_tags: list = []
-    
+    tag_groups: dict[str, list[str]] = {}
+    all_tags: list[str] = []
+    group_ngrams: dict[str, set[str]] = {}  # trigram -> group names containing it
+    tag_ngrams: dict[str, list[int]] = {}  # trigram of a padded word -> positions of the tags containing it
+    short_tags: list[int] = []  # positions of the tags with words too short for trigrams, always fuzzy matched
+    index_task: asyncio.Task | None = None
+
+    @classmethod
+    def load_index(cls, cog: AgentCogBase) -> asyncio.Task:
+        """Starts loading the index in a worker thread if it isn't loaded or loading already."""
+        if cls.index_task is None or cls.index_task.done() and not cls.tag_groups:
+            source_path = bundled_data_path(cog).absolute() / "tag_groups.json"
+            cache_path = cog_data_path(cog).absolute() / "tag_groups_index.json"
+            cls.index_task = asyncio.create_task(cls._load_index(source_path, cache_path))
+        return cls.index_task
+
+    @classmethod
+    async def _load_index(cls, source_path: Path, cache_path: Path):
+        start = time.perf_counter()
+        try:
+            tag_groups, from_cache = await asyncio.to_thread(cls.read_index, source_path, cache_path)
+        except (OSError, ValueError):
+            log.exception("Loading booru tag index")
+            return
+        cls.tag_groups, cls.all_tags, cls.group_ngrams, cls.tag_ngrams, cls.short_tags = await asyncio.to_thread(cls.build_lookups, tag_groups)
+        elapsed_ms = int(1000 * (time.perf_counter() - start))
+        log.info(f"Loaded booru tag index with {len(cls.all_tags)} tags in {len(cls.tag_groups)} groups {from_cache=} {elapsed_ms=}")
+
     @classmethod
-    def build_index(cls, data: dict[str, Any]):
-        cls.tag_groups = {}
+    def read_index(cls, source_path: Path, cache_path: Path) -> tuple[dict[str, list[str]], bool]:
+        """Reads the processed tag groups from disk, or builds them again if the source file changed."""
+        source = source_path.read_bytes()
+        source_hash = hashlib.sha256(source).hexdigest()
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("hash") == source_hash:
+                return cached["groups"], True
+        except (OSError, ValueError, KeyError):
+            pass
+        tag_groups = cls.build_index(json.loads(source))
+        try:
+            cache_path.write_text(json.dumps({"hash": source_hash, "groups": tag_groups}, separators=(",", ":")), encoding="utf-8")
+        except OSError as error:
+            log.warning(f"Saving booru tag index: {type(error).__name__}: {error}")
+        return tag_groups, False
+
+    @staticmethod
+    def build_index(data: dict[str, Any]) -> dict[str, list[str]]:
+        tag_groups = {}
         for _, group_content in data.items():
             for subgroup_name, subgroup_content in group_content.items():
                 if isinstance(subgroup_content, dict):
                     vals = [v if isinstance(v, (list, tuple)) else [v]
                             for v in subgroup_content.values()]
                     merged = list(itertools.chain.from_iterable(vals))
-                    cls.tag_groups[clean_tag(subgroup_name)] = [clean_tag(t) for t in merged if t is not None]
+                    tag_groups[clean_tag(subgroup_name)] = [clean_tag(t) for t in merged if t is not None]
                 elif isinstance(subgroup_content, list):
-                    cls.tag_groups[clean_tag(subgroup_name)] = [clean_tag(tag) for tag in subgroup_content]
-        cls.all_tags = list(itertools.chain.from_iterable(cls.tag_groups.values()))                
+                    tag_groups[clean_tag(subgroup_name)] = [clean_tag(tag) for tag in subgroup_content]
+        return tag_groups
+
+    @staticmethod
+    def word_trigrams(text: str) -> set[str]:
+        """Trigrams of each word padded with spaces, so that a typo in a short word still leaves its start or end."""
+        trigrams = set()
+        for word in text.split():
+            padded = f" {word} "
+            trigrams.update(padded[i:i+3] for i in range(len(padded) - 2))
+        return trigrams
+
+    @classmethod
+    def build_lookups(cls, tag_groups: dict[str, list[str]]) -> tuple[dict[str, list[str]], list[str], dict[str, set[str]], dict[str, list[int]], list[int]]:
+        all_tags = list(dict.fromkeys(itertools.chain.from_iterable(tag_groups.values())))
+        group_ngrams: dict[str, set[str]] = {}
+        for group in tag_groups:
+            for i in range(len(group) - 2):
+                group_ngrams.setdefault(group[i:i+3], set()).add(group)
+        tag_ngrams: dict[str, list[int]] = {}
+        short_tags = []
+        for position, tag in enumerate(all_tags):
+            for trigram in cls.word_trigrams(tag):
+                tag_ngrams.setdefault(trigram, []).append(position)
+            if min(map(len, tag.split()), default=0) < 3:
+                short_tags.append(position)
+        return tag_groups, all_tags, group_ngrams, tag_ngrams, short_tags
+
+    @classmethod
+    def search_groups(cls, query: str) -> list[str]:
+        """Group names containing the query, narrowed down through their trigrams."""
+        if len(query) < 3:
+            return [group for group in cls.tag_groups if query in group]
+        ngrams = [cls.group_ngrams.get(query[i:i+3], set()) for i in range(len(query) - 2)]
+        candidates = set.intersection(*sorted(ngrams, key=len))
+        return [group for group in candidates if query in group]
+
+    @classmethod
+    def fuzzy_candidates(cls, query: str) -> list[str]:
+        """
+        Tags sharing a word trigram with the query, plus tags with short words that can match inside longer words.
+        These are the only ones that can reach the fuzzy threshold in practice, so WRatio doesn't have to score every tag.
+        Kept in their original order so that ties are broken the same way as when scoring every tag.
+        """
+        positions = set(cls.short_tags)
+        for trigram in cls.word_trigrams(query):
+            positions.update(cls.tag_ngrams.get(trigram, ()))
+        return [cls.all_tags[position] for position in sorted(positions)]
         
     @classmethod
     def search_booru_tags(cls, query: str, fuzzy_threshold: int = 80) -> list[str]:
         query = clean_tag(query)
         matches: set[str] = set()
 
-        for group, tags in cls.tag_groups.items():
-            if query in group:
-                matches.update(tags)
+        for group in cls.search_groups(query):
+            matches.update(cls.tag_groups[group])
         
-        fuzzy = process.extract(query, cls.all_tags, scorer=fuzz.WRatio, score_cutoff=fuzzy_threshold, limit=None)
+        fuzzy = process.extract(query, cls.fuzzy_candidates(query), scorer=fuzz.WRatio, score_cutoff=fuzzy_threshold, limit=BOORU_TAGS_FUZZY_LIMIT)
         for tag, _, _ in fuzzy:
             matches.add(tag)
 
@@ -70,12 +163,13 @@ class BooruTagsTool(ToolBase):
         emoji = self.get_setting("boorutag_emoji")
         asyncio.create_task(self.ctx.message.add_reaction(emoji))
 
+        await asyncio.shield(self.load_index(self.cog))
         if not self.tag_groups:
-            async with aiofiles.open(bundled_data_path(self.cog).absolute() / "tag_groups.json", "r") as fp:
-                data = json.loads(await fp.read())
-            self.build_index(data)
-
-        results = self.search_booru_tags(query)
+            return "<error>The tag database is unavailable</error>"
+        start = time.perf_counter()
+        results = await asyncio.to_thread(self.search_booru_tags, query)
+        search_ms = int(1000 * (time.perf_counter() - start))
+        log.info(f"{query=} results={len(results)} {search_ms=}")
         if results:
             return f"`{', '.join(results)}`"
         else:
@@ -8,6 +8,8 @@ from agent.tools.base import ToolBase
 
 
 class GptImageToolBase(ToolBase):
+    timeout = 300
+
     async def find_attachment(self, filename: str, messages: list[discord.Message], consumed: list[discord.Attachment]) -> discord.Attachment | None:
         assert self.ctx.guild
         for message in messages:
@@ -59,8 +61,9 @@ class GptImageToolBase(ToolBase):
 
         attachments: list[discord.Attachment] = []
         if existing:
+            # the latest backread_messages + 1 messages including the trigger, regardless of [p]forget
             limit = self.cog.config[self.ctx.guild].backread_messages.value
-            messages = [message async for message in self.ctx.channel.history(limit=limit+1)]
+            messages = await self.cog.fetch_message_history(self.ctx, limit=limit, ignore_start=True)
             if self.ctx.message and self.ctx.message.reference and self.ctx.message.reference.message_id:
                 quoted = self.ctx.message.reference.cached_message or await self.ctx.channel.fetch_message(self.ctx.message.reference.message_id)
                 messages.insert(0, quoted)
@@ -6,6 +6,7 @@ from redbot.core import commands
 from agent.utils import get_filename, clean_tag, normalize_image
 from agent.schema import ToolCall, Function, Parameters
 from agent.tools.base import ToolBase
+from agent.constants import IMAGE_PROCESSING_TIMEOUT
 
 log = logging.getLogger("agent.imagetagger")
 
@@ -29,8 +30,9 @@ class ImageTaggingTool(ToolBase):
 
     async def find_image(self, filename: str) -> discord.Attachment | str | None:
         assert self.ctx.guild
-        limit = self.cog.config[self.ctx.guild].backread_messages.value
-        messages = [message async for message in self.ctx.channel.history(limit=limit)]
+        # the latest backread_messages messages including the trigger, regardless of [p]forget
+        limit = self.cog.config[self.ctx.guild].backread_messages.value - 1
+        messages = await self.cog.fetch_message_history(self.ctx, limit=limit, ignore_start=True)
         if self.ctx.message and self.ctx.message.reference and self.ctx.message.reference.message_id:
             quoted = await self.ctx.channel.fetch_message(self.ctx.message.reference.message_id)
             messages.insert(0, quoted)
@@ -70,7 +72,7 @@ class ImageTaggingTool(ToolBase):
                     response.raise_for_status()
                     image_bytes = await response.read()
             max_resolution = self.cog.config[self.ctx.guild].max_image_resolution.value
-            fp = await asyncio.to_thread(normalize_image, image_bytes, max_resolution**2)
+            fp = await self.cog.image_pool.run(IMAGE_PROCESSING_TIMEOUT, normalize_image, image_bytes, max_resolution**2, None, "PNG")
             if not fp:
                 return f"<error>The image appears to be corrupted or invalid</error>"
             tags = await arcenciel.api.interrogate(fp, filename.rsplit(".", 1)[0] + ".png")  # type: ignore
@@ -1,20 +1,24 @@
 import re
+import time
 import logging
 import asyncio
 import aiohttp
 import trafilatura
 from typing import Awaitable, Callable, OrderedDict
+from concurrent.futures.process import BrokenProcessPool
 
 from agent.utils import parse_arcenciel_model
 from agent.schema import ToolCall, Function, Parameters
 from agent.tools.base import ToolBase
 from agent.constants import GITHUB_FILE_URL_PATTERN, ARCENCIEL_MODEL_URL_PATTERN
+from agent.constants import SCRAPE_MAX_BYTES, SCRAPE_MAX_HTML, SCRAPE_EXTRACTION_TIMEOUT
 
 log = logging.getLogger("agent.scrape")
 
 
 class ScrapeTool(ToolBase):
     display_name = "scrape"
+    timeout = 30
     settings = {"scrape_emoji": "🔗"}
     schema = ToolCall(
         Function(
@@ -55,20 +59,55 @@ class ScrapeTool(ToolBase):
         return await self.scrape_generic(url)
 
     async def scrape_generic(self, url: str) -> str:
+        cache = self.cog.url_cache
+        cached = cache.get(url)
+        if cached and cache.is_fresh(cached):
+            return cache.hit(url, cached)  # type: ignore
+        headers = {**self.headers, **cache.conditional_headers(cached)}
         try:
-            async with self.cog.session.get(url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            async with self.cog.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 304 and cached:
+                    return cache.hit(url, cached, revalidated=True)  # type: ignore
                 response.raise_for_status()
                 content_type = response.headers.get("Content-Type", "").lower()
                 if "text" not in content_type:
                     return f"<error>Contents of {url} is not text</error>"
-                text = await response.text()
-                content = trafilatura.extract(text) or text
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                body = await self.read_limited(response)
+                text = body.decode(response.charset or "utf-8", errors="replace")
         except asyncio.TimeoutError:
             return "<error>Timed out.</error>"
         except aiohttp.ClientError as error:
             log.warning(f"Opening {url}: {type(error).__name__}: {error}")
             return f"<error>Failed to open URL ({type(error).__name__})</error>"
-        return content or "<error>The page is empty.</error>"
+
+        if "html" in content_type:
+            start = time.perf_counter()
+            try:
+                content = await self.cog.worker_pool.run(SCRAPE_EXTRACTION_TIMEOUT, trafilatura.extract, text[:SCRAPE_MAX_HTML])
+            except (asyncio.TimeoutError, BrokenProcessPool):
+                return "<error>Timed out while reading the page.</error>"
+            extraction_ms = int(1000 * (time.perf_counter() - start))
+            log.info(f"Opened {url}: bytes_read={len(body)} {extraction_ms=}")
+            content = content or text
+        else:
+            log.info(f"Opened {url}: bytes_read={len(body)}")
+            content = text
+        if not content:
+            return "<error>The page is empty.</error>"
+        cache.put(url, content, etag, last_modified)
+        return content
+
+    @staticmethod
+    async def read_limited(response: aiohttp.ClientResponse) -> bytes:
+        """Reads a response body up to SCRAPE_MAX_BYTES, ignoring the rest."""
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) >= SCRAPE_MAX_BYTES:
+                del body[SCRAPE_MAX_BYTES:]
+                break
+        return bytes(body)
     
     async def scrape_github_file(self, match: re.Match) -> str:
         user = match.group("user")
@@ -81,12 +120,22 @@ class ScrapeTool(ToolBase):
     async def scrape_arcenciel_model(self, match: re.Match) -> dict | str:
         model_id = match.group("id")
         url = f"https://arcenciel.io/api/models/{model_id}"
+        cache = self.cog.url_cache
+        cached = cache.get(url)
+        if cached and cache.is_fresh(cached):
+            return cache.hit(url, cached)
+        headers = {**self.headers, **cache.conditional_headers(cached)}
         try:
-            async with self.cog.session.get(url, headers=self.headers) as response:
+            async with self.cog.session.get(url, headers=headers) as response:
+                if response.status == 304 and cached:
+                    return cache.hit(url, cached, revalidated=True)
                 response.raise_for_status()
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
                 data = await response.json()
         except aiohttp.ClientError as error:
             log.warning(f"Opening {url}: {type(error).__name__}: {error}")
             return "<error>Failed to open URL</error>"
         
-        return {"model": parse_arcenciel_model(data)}
+        content = {"model": parse_arcenciel_model(data)}
+        cache.put(url, content, etag, last_modified)
+        return dict(content)
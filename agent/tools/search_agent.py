@@ -10,6 +10,7 @@ log = logging.getLogger("agent.searchweb")
 
 class AgenticSearchTool(ToolBase):
     display_name = "agent_search"
+    timeout = 120
     settings = {"search_emoji": "🌐"}
     schema = ToolCall(
         Function(
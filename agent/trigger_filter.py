@@ -0,0 +1,70 @@
+import discord
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from agent.base import AgentCogGuildConfig
+
+# fields that the decision table is built from
+TRIGGER_FIELDS = {
+    "channel_mode", "channels", "auto_channel_mode", "auto_channels",
+    "autoresponder_chance", "autoreacter_chance", "autoreacter_chance_images",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class GuildTriggers:
+    whitelist: bool
+    channels: frozenset[int]
+    auto_whitelist: bool
+    auto_channels: frozenset[int]
+    auto_enabled: bool
+
+    @classmethod
+    def from_config(cls, config: "AgentCogGuildConfig") -> "GuildTriggers":
+        return cls(
+            whitelist=config.channel_mode.value == "whitelist",
+            channels=frozenset(config.channels.value),
+            auto_whitelist=config.auto_channel_mode.value == "whitelist",
+            auto_channels=frozenset(config.auto_channels.value),
+            auto_enabled=max(config.autoresponder_chance.value, config.autoreacter_chance.value, config.autoreacter_chance_images.value) > 0,
+        )
+
+    def accepts(self, channel_id: int, mentioned: bool) -> bool:
+        if (channel_id in self.channels) != self.whitelist:
+            return False
+        if mentioned:
+            return True
+        return self.auto_enabled and (channel_id in self.auto_channels) == self.auto_whitelist
+
+
+class TriggerFilter:
+    """
+    Rejects messages that can't trigger a response or reaction with a lookup in a per-guild decision table,
+    before any of the more expensive checks. Tables are rebuilt from the guild config whenever a relevant field changes.
+    """
+    def __init__(self):
+        self.guilds: dict[int, GuildTriggers] = {}
+        self.checked = 0
+        self.rejected = 0
+
+    @property
+    def rejection_ratio(self) -> float:
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def get(self, guild_id: int) -> GuildTriggers | None:
+        return self.guilds.get(guild_id)
+
+    def build(self, guild_id: int, config: "AgentCogGuildConfig") -> GuildTriggers:
+        triggers = self.guilds[guild_id] = GuildTriggers.from_config(config)
+        return triggers
+
+    def accepts(self, triggers: GuildTriggers, message: discord.Message, bot_user: discord.ClientUser | None) -> bool:
+        self.checked += 1
+        if message.author.bot or not triggers.accepts(message.channel.id, bot_user in message.mentions):
+            self.rejected += 1
+            return False
+        return True
+
+    def invalidate(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
@@ -0,0 +1,114 @@
+import time
+import logging
+from dataclasses import dataclass
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from agent.constants import URL_CACHE_MAX_SIZE, URL_CACHE_TTL, URL_CACHE_MAX_AGE
+
+log = logging.getLogger("agent.url_cache")
+
+TRACKING_PARAMETERS = ("utm_", "fbclid", "gclid", "ref_src")
+
+
+@dataclass
+class UrlCacheEntry:
+    content: str | dict
+    size: int
+    fetched_at: float
+    validated_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class UrlCache:
+    """
+    Extracted contents of recently opened URLs, shared by every tool call.
+    Entries are fresh for a short time, after which they're revalidated with a conditional request if the server allows it.
+    The total size is bounded by characters, evicting the least recently used entries.
+    """
+    def __init__(self, max_size: int = URL_CACHE_MAX_SIZE, ttl: float = URL_CACHE_TTL, max_age: float = URL_CACHE_MAX_AGE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_age = max_age
+        self.entries: OrderedDict[str, UrlCacheEntry] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.revalidations + self.misses
+        return (self.hits + self.revalidations) / total if total else 0.0
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        """Removes differences between URLs that point to the same content."""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower() or "https"
+        host = (parts.hostname or "").lower()
+        if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+            host += f":{parts.port}"
+        query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not key.lower().startswith(TRACKING_PARAMETERS))
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+    def get(self, url: str) -> UrlCacheEntry | None:
+        """Returns an entry that's either fresh or can be revalidated, without counting it as a hit."""
+        key = self.normalize(url)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        expired = now - entry.fetched_at > self.max_age
+        unverifiable = now - entry.validated_at > self.ttl and not entry.etag and not entry.last_modified
+        if expired or unverifiable:
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: UrlCacheEntry) -> bool:
+        return time.time() - entry.validated_at <= self.ttl
+
+    @staticmethod
+    def conditional_headers(entry: UrlCacheEntry | None) -> dict[str, str]:
+        headers = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def hit(self, url: str, entry: UrlCacheEntry, revalidated: bool = False) -> str | dict:
+        if revalidated:
+            entry.validated_at = time.time()
+            self.revalidations += 1
+        else:
+            self.hits += 1
+        log.info(f"URL cache {'revalidated' if revalidated else 'hit'} for {url} ({self.hit_ratio:.1%} hit ratio)")
+        return dict(entry.content) if isinstance(entry.content, dict) else entry.content
+
+    def put(self, url: str, content: str | dict, etag: str | None = None, last_modified: str | None = None):
+        self.misses += 1
+        key = self.normalize(url)
+        size = len(content) if isinstance(content, str) else len(str(content))
+        if size > self.max_size // 4:
+            self.pop(key)
+            return
+        now = time.time()
+        self.pop(key)
+        self.entries[key] = UrlCacheEntry(content, size, now, now, etag, last_modified)
+        self.size += size
+        while self.size > self.max_size:
+            self.pop(next(iter(self.entries)))
+
+    def pop(self, key: str):
+        if entry := self.entries.pop(key, None):
+            self.size -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -1,12 +1,12 @@
 import os
 import re
+import time
 import logging
 import asyncio
 import discord
 import contextlib
 import trafilatura
 from io import BytesIO
-from copy import deepcopy
 from base64 import b64encode
 from typing import Callable
 from datetime import datetime
@@ -18,6 +18,8 @@ from openai import Omit
 
 from agent.schema import AgentImageContent, AgentMessage, StructuredObject
 from agent.constants import MAX_MESSAGE_LENGTH, NEWLINE_SEPARATOR_PATTERN, DATETIME_FORMATTING, XML_TAG_PATTERN, UNCLOSED_XML_TAG_PATTERN, EMOTE_PATTERN
+from agent.constants import RESPONSE_CLEANUP_PATTERNS, INCOMPLETE_EMOTE_PATTERN, FAKE_EMOTE_PATTERN
+from agent.constants import IMAGE_MAX_BYTES, IMAGE_QUALITY_STEPS, IMAGE_GRAPHIC_MAX_COLORS
 
 log = logging.getLogger("agent.utils")
 
@@ -84,9 +86,18 @@ def farenheit_to_celsius(match: re.Match) -> str:
     c = (f - 32) * 5.0/9.0
     return f"{round(c)}°C/{round(f)}°F"
 
+def image_mime_type(b: bytes) -> str:
+    if b.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if b[:4] == b"RIFF" and b[8:12] == b"WEBP":
+        return "image/webp"
+    if b.startswith(b"GIF8"):
+        return "image/gif"
+    return "image/png"
+
 def make_image_content(b: bytes | BytesIO, low_detail: bool = False) -> AgentImageContent:
     b = b.read() if isinstance(b, BytesIO) else b
-    image_url = {"url": f"data:image/png;base64,{b64encode(b).decode()}"}
+    image_url = {"url": f"data:{image_mime_type(b)};base64,{b64encode(b).decode()}"}
     if low_detail:
         image_url["detail"] = "low"
     return {
@@ -106,30 +117,70 @@ def scale_to_size(width: int, height: int, pixels: int) -> tuple[int, int]:
     scale = (pixels / (width * height)) ** 0.5
     return int(width * scale), int(height * scale)
 
-def normalize_image(b: bytes | BytesIO, max_pixels: int | None = None, thumbnail_size: int | None = None) -> bytes | None:
+def normalize_image(b: bytes | BytesIO, max_pixels: int | None = None, thumbnail_size: int | None = None, format: str | None = None) -> bytes | None:
+    """
+    Converts an image to RGB and shrinks it to fit in max_pixels and a thumbnail_size square.
+    Uses the given format, or the most compact one for the model as chosen by encode_image.
+    CPU-bound, should be run in the worker pool.
+    """
     b = b if isinstance(b, BytesIO) else BytesIO(b)
     b.seek(0)
     try:
         image = Image.open(b)
+        width, height = image.size
+        if max_pixels and width*height > max_pixels:
+            width, height = scale_to_size(width, height, max_pixels)
+        if thumbnail_size and (width > thumbnail_size or height > thumbnail_size):
+            scale = min(thumbnail_size / width, thumbnail_size / height)
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        if image.format == "JPEG" and (width, height) != image.size:
+            image.draft("RGB", (width, height))  # decodes at a fraction of the size, no smaller than the target
+        image.load()
     except (UnidentifiedImageError, OSError):
         return None
-    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
-        image_rgba = image.convert("RGBA")
+    transparent = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert("RGBA" if transparent else "RGB")
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if transparent and image.getchannel("A").getextrema()[0] < 255:
         background = Image.new("RGB", image.size, (0, 0, 0))
-        background.paste(image_rgba, (0, 0), image_rgba.getchannel("A"))
+        background.paste(image, (0, 0), image.getchannel("A"))
         image = background
     else:
         image = image.convert("RGB")
-    format = "PNG"
-    if max_pixels and image.width*image.height > max_pixels:
-        width, height = scale_to_size(image.width, image.height, max_pixels)
-        image = image.resize((width, height), Image.Resampling.LANCZOS)
-    if thumbnail_size:
-        format = "JPEG"
-        image.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
-    fp = BytesIO()
-    image.save(fp, format, quality=90)
-    return fp.getvalue()
+    if format:
+        fp = BytesIO()
+        image.save(fp, format, quality=90)
+        return fp.getvalue()
+    return encode_image(image, thumbnail=bool(thumbnail_size))
+
+def encode_image(image: Image.Image, thumbnail: bool = False, max_bytes: int = IMAGE_MAX_BYTES) -> bytes:
+    """
+    Encodes an RGB image as compactly as its content allows:
+    JPEG for photos and thumbnails, WebP for graphics with flat colors like screenshots, where JPEG blurs text.
+    Lowers the quality until the result fits in max_bytes, or until the lowest quality step.
+    """
+    sample = image.resize((128, 128), Image.Resampling.NEAREST)
+    graphic = not thumbnail and sample.getcolors(maxcolors=IMAGE_GRAPHIC_MAX_COLORS) is not None
+    format = "WEBP" if graphic else "JPEG"
+    data = b""
+    for quality in IMAGE_QUALITY_STEPS:
+        fp = BytesIO()
+        image.save(fp, format, quality=quality)
+        data = fp.getvalue()
+        if len(data) <= max_bytes:
+            break
+    return data
+
+def image_payload_bytes(messages: list[AgentMessage]) -> int:
+    """The size of the encoded images that will be uploaded along with a list of messages."""
+    total = 0
+    for msg in messages:
+        if isinstance(msg, dict) and isinstance(msg.get("content"), list):
+            for cnt in msg["content"]:
+                if isinstance(cnt, dict) and cnt.get("type") == "image_url":
+                    total += len(cnt["image_url"]["url"])  # type: ignore
+    return total
 
 def button_label(button: discord.Button):
     emoji_name = button.emoji if not button.emoji or isinstance(button.emoji, str) else f":{button.emoji.name}:"
@@ -139,9 +190,10 @@ def get_text_contents(messages: list[AgentMessage]) -> list[AgentMessage]:
     """
     Converts a list of mixed OpenAI message dicts into a list of text-only message dicts,
     and overrides all the message roles to user.
+    The new dicts share their strings with the original messages, and image payloads are never visited.
     """
     temp_messages = []
-    for msg in deepcopy(messages):
+    for msg in messages:
         if isinstance(msg["content"], str):
             temp_messages.append({
                 "role": "user",
@@ -216,13 +268,15 @@ def parse_arcenciel_model(data: dict) -> StructuredObject:
     return obj
 
 
-async def chunk_and_send(ctx: commands.Context,
-                         full_text: str,
-                         embed: discord.Embed = None,
-                         view: discord.ui.View = None,
-                         files: list[discord.File] = None,
-                         do_reply: bool = False
-                        ):
+def clean_response(bot: Red, text: str) -> str:
+    for _, pattern, repl in RESPONSE_CLEANUP_PATTERNS:
+        text = pattern.sub(repl, text)
+    text = INCOMPLETE_EMOTE_PATTERN.sub(fix_emote(bot), text)
+    text = FAKE_EMOTE_PATTERN.sub("\n", text)
+    return undo_xml(text).strip()
+
+def chunk_text(full_text: str) -> list[str]:
+    """Splits text into chunks that fit in a Discord message, keeping code blocks intact."""
     base_lines = full_text.splitlines(keepends=True)
     lines = []
     for base_line in base_lines:
@@ -262,7 +316,21 @@ async def chunk_and_send(ctx: commands.Context,
         current += line
 
     flush_chunk()
+    return chunks
+
 
+async def chunk_and_send(ctx: commands.Context,
+                         full_text: str,
+                         embed: discord.Embed = None,
+                         view: discord.ui.View = None,
+                         files: list[discord.File] = None,
+                         do_reply: bool = False
+                        ) -> float | None:
+    """Sends text split into as many messages as needed, with the attachments on the last one. Returns when the first message was sent."""
+    chunks = chunk_text(full_text)
+    if not chunks and (embed or view or files):
+        chunks = [""]
+    first_sent_at = None
     for i, chunk in enumerate(chunks):
         current_reference, current_embed, current_view = None, None, None
         current_files = []
@@ -280,8 +348,11 @@ async def chunk_and_send(ctx: commands.Context,
             allowed_mentions=discord.AllowedMentions.none(),
             mention_author=False
         )
+        if first_sent_at is None:
+            first_sent_at = time.perf_counter()
         if view and hasattr(view, "message"):
             setattr(view, "message", msg)
+    return first_sent_at
 
 
 @contextlib.asynccontextmanager
@@ -1,22 +1,23 @@
 import discord
+from typing import Collection
 from discord.ui import View
 
 from agent.constants import VIEW_TIMEOUT, MAX_EMBED_DESCRIPTION
 
 
 class MemoryListView(View):
-    def __init__(self, memories: list[str]):
+    def __init__(self, memories: list[str], member_names: Collection[str]):
         super().__init__(timeout=VIEW_TIMEOUT)
         self.memories = memories
+        self.member_names = member_names
         self.message: discord.Message | None = None
         self.button = discord.ui.Button(emoji="🧠", label="Memories...", style=discord.ButtonStyle.gray)
         self.button.callback = self.show_info
         self.add_item(self.button)
 
     async def show_info(self, interaction: discord.Interaction):
-        assert interaction.guild
         embed = discord.Embed()
-        user_memories = [memory for memory in self.memories if any(member.name == memory for member in interaction.guild.members)]
+        user_memories = [memory for memory in self.memories if memory in self.member_names]
         normal_memories = [memory for memory in self.memories if memory not in user_memories]
         embed.description = "🧠 `[Memories:]`\n> " + ", ".join(f"`{mem}`" for mem in normal_memories)
         embed.description += "\n\n👥 `[User memories:]`\n> " + ", ".join(f"`{mem}`" for mem in user_memories)
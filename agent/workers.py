@@ -0,0 +1,94 @@
+import os
+import site
+import asyncio
+import logging
+from typing import Any, Callable, TypeVar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+log = logging.getLogger("agent.workers")
+
+T = TypeVar("T")
+
+# workers are separate interpreters and need to find this package to run functions defined in it
+COGS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WorkerPool:
+    """
+    Runs CPU-bound work like HTML extraction and image processing in separate processes,
+    so that it doesn't block the event loop and can be stopped when it exceeds its time limit.
+    The processes are only started once they're first needed, and other cogs may use them through the agent cog.
+    """
+    def __init__(self, name: str, max_workers: int, max_queued: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor: ProcessPoolExecutor | None = None
+        self.slots = asyncio.Semaphore(max_workers + max_queued)
+        self.running = asyncio.Semaphore(max_workers)
+        self.jobs: dict[ProcessPoolExecutor, set[asyncio.Future]] = {}
+        self.retiring: set[asyncio.Task] = set()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.max_workers, initializer=site.addsitedir, initargs=(COGS_PATH,))
+            self.jobs[self.executor] = set()
+        return self.executor
+
+    async def run(self, timeout: float, func: Callable[..., T], *args: Any) -> T:
+        """
+        Runs a picklable function in a worker. Raises asyncio.TimeoutError or BrokenProcessPool on failure.
+        Waits for a slot first when the queue is full, so that a burst of work can't pile up indefinitely.
+        Jobs are only handed to the executor once a worker is free, so the time limit doesn't count time spent queued.
+        """
+        loop = asyncio.get_running_loop()
+        async with self.slots, self.running:
+            executor = self.get_executor()
+            future = loop.run_in_executor(executor, func, *args)
+            jobs = self.jobs[executor]
+            jobs.add(future)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                log.warning(f"{getattr(func, '__name__', func)} exceeded its time limit of {timeout} seconds in the {self.name} pool, replacing its worker")
+                self.retire(executor)
+                raise
+            except BrokenProcessPool:
+                self.retire(executor)
+                raise
+            finally:
+                jobs.discard(future)
+
+    def retire(self, executor: ProcessPoolExecutor):
+        """
+        Sends new jobs to a new executor, and stops the old one once its other jobs are done,
+        which also stops the worker stuck in the job that timed out.
+        """
+        if executor is not self.executor:
+            return  # already retired
+        self.executor = None
+        task = asyncio.create_task(self._retire(executor))
+        self.retiring.add(task)
+        task.add_done_callback(self.retiring.discard)
+
+    async def _retire(self, executor: ProcessPoolExecutor):
+        others = [job for job in self.jobs.get(executor, ()) if not job.done()]
+        if others:
+            await asyncio.wait(others)  # each of them is bounded by its own time limit
+        self.terminate(executor)
+
+    def terminate(self, executor: ProcessPoolExecutor):
+        self.jobs.pop(executor, None)
+        # the executor can't cancel running tasks by itself
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self):
+        for task in self.retiring:
+            task.cancel()
+        for executor in list(self.jobs):
+            self.terminate(executor)
+        self.executor = None
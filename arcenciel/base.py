@@ -1,5 +1,6 @@
+import asyncio
 import discord
-from typing import Coroutine
+from typing import Any, Callable, Coroutine, TypeVar
 from datetime import datetime
 from collections import defaultdict
 from expiringdict import ExpiringDict
@@ -8,6 +9,9 @@ from redbot.core.bot import Red
 
 from arcenciel.comfy import ComfyMetadata
 from arcenciel.schema import ImageGenParams, QueuedImageGen
+from arcenciel.constants import IMAGE_PROCESSING_TIMEOUT
+
+T = TypeVar("T")
 
 
 class ArcencielBase(commands.Cog):
@@ -55,6 +59,13 @@ class ArcencielBase(commands.Cog):
         self.config.register_member(**default_user)
         self.config.register_global(**default_global)
 
+    async def run_image_task(self, func: Callable[..., T], *args: Any) -> T:
+        """Runs image processing in the worker processes of the agent cog if it's loaded, or in a thread otherwise."""
+        image_pool = getattr(self.bot.get_cog("AgentCog"), "image_pool", None)
+        if image_pool:
+            return await image_pool.run(IMAGE_PROCESSING_TIMEOUT, func, *args)
+        return await asyncio.to_thread(func, *args)
+
     async def cache_set(self, hint: str, hyperlink: str | None) -> None:
         if hyperlink is None:
             self.resource_not_found_cache[hint] = True
@@ -4,6 +4,7 @@ import asyncio
 import aiohttp
 import discord
 from copy import copy
+from concurrent.futures.process import BrokenProcessPool
 from PIL.Image import UnidentifiedImageError
 
 from redbot.core import app_commands, checks, commands
@@ -351,13 +352,19 @@ class ArcencielCommands(ArcencielSettings):
 
         try:
             image_name = image.filename.rsplit(".", 1)[0] + ".png"
-            image_bytes = await asyncio.to_thread(normalize_image, await image.read(), maxsize)
+            image_bytes = await self.run_image_task(normalize_image, await image.read(), maxsize)
         except UnidentifiedImageError:
             log.warning(f"Invalid image {image_name}")
             return await interaction.followup.send("The file you uploaded is corrupted or invalid.", ephemeral=True)
+        except asyncio.TimeoutError:
+            log.warning(f"Timed out processing image {image_name}")
+            return await interaction.followup.send("The file you uploaded took too long to process. Try a smaller image.", ephemeral=True)
+        except BrokenProcessPool:
+            log.exception("img2img")
+            return await interaction.followup.send("The image processor crashed while reading your image. Please try again.", ephemeral=True)
         except Exception as error:
             log.exception("img2img")
-            await ctx.reply(f":warning: There was a problem with the image. `{type(error).__name__}: {error}`")
+            return await ctx.reply(f":warning: There was a problem with the image. `{type(error).__name__}: {error}`")
 
         img2img_params = ImageToImageParams(
             image_bytes,
@@ -429,11 +436,17 @@ class ArcencielCommands(ArcencielSettings):
         assert self.api
         try:
             image_name = attachment.filename.rsplit(".", 1)[0] + ".png"
-            image_bytes = await asyncio.to_thread(normalize_image, await attachment.read(), MAX_UPLOAD_PIXELS)
+            image_bytes = await self.run_image_task(normalize_image, await attachment.read(), MAX_UPLOAD_PIXELS)
             tags = await self.api.interrogate(image_bytes, image_name)
         except UnidentifiedImageError:
             log.warning(f"Invalid image {image_name}")
             await ctx.reply(f":warning: The image you uploaded is corrupted or invalid.")
+        except asyncio.TimeoutError:
+            log.warning(f"Timed out processing image {image_name}")
+            await ctx.reply(f":warning: The image you uploaded took too long to process. Try a smaller image.")
+        except BrokenProcessPool:
+            log.exception("Autotagger")
+            await ctx.reply(f":warning: The image processor crashed while reading your image. Please try again.")
         except aiohttp.ClientResponseError as error:
             log.exception("Autotagger")
             await ctx.reply(f":warning: Failed to tag the image! `{error.message}`")
@@ -6,6 +6,7 @@ VIEW_TIMEOUT = 15 * 60
 JOB_TIMEOUT = 10 * 60
 PROGRESS_UPDATE_INTERVAL = 5
 MAX_UPLOAD_PIXELS = 2048*2048
+IMAGE_PROCESSING_TIMEOUT = 30
 MAX_MESSAGE_LENGTH = 2000
 
 SUPPORTED_IMAGE_TYPES = ["png", "jpg", "jpeg"]
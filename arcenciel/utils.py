@@ -64,7 +64,9 @@ def normalize_image(b: bytes | BytesIO, max_pixels: int) -> bytes:
     image = Image.open(b)
     if image.width*image.height > max_pixels:
         width, height = scale_to_size(image.width, image.height, max_pixels)
-        image = image.resize((width, height), Image.Resampling.LANCZOS)
+        if image.format == "JPEG":
+            image.draft(image.mode, (width, height))  # decodes at a fraction of the size, no smaller than the target
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
     fp = BytesIO()
     image.save(fp, "PNG")
     return fp.getvalue()